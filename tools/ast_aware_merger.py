@@ -7,18 +7,59 @@ and ensure proper merging without the issues of regex-based parsing.
 """
 
 import argparse
+import hashlib
+import os
+import pickle
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
+import clang.cindex
 from cpp_ast_parser import CppASTParser
 from datetime import datetime
 
+# Per-module parse results, keyed by content hash
+CACHE_DIR = Path.home() / ".cache" / "trace-scope" / "ast"
+
+# Parsed modules.txt, stored next to it and keyed by its mtime and size
+MODULES_CACHE_NAME = ".modules.cache"
+
+# Preprocessor directives relevant to define extraction (#if covers #ifdef)
+DIRECTIVE_RE = re.compile(rb'^[ \t\f\v]*#(ifndef|if|endif|define).*$', re.MULTILINE)
+GUARD_DEFINE_RE = re.compile(rb'[ \t\f\v]*#define')
+SKIP_CONDITIONAL_RE = re.compile(rb'^[ \t\f\v]*#(if|endif)', re.MULTILINE)
+CONDITIONAL_RE = re.compile(r'^[ \t]*#[ \t]*(if|ifdef|ifndef|endif)\b', re.MULTILINE)
+
+def _parse_one(path_str: str, use_cache: bool = True) -> Dict:
+    """Parse a single module and extract the data needed for merging.
+    
+    Runs in a worker process, so it must stay a module-level function.
+    """
+    module_path = Path(path_str)
+    parser = CppASTParser(path_str, use_cache=use_cache)
+    return {
+        'includes': parser.extract_includes(),
+        'namespace': parser.extract_namespace_body('trace'),
+        'macros': parser.extract_macros(),
+        'defines': ASTAwareMerger._extract_defines_from_file(module_path),
+        'diagnostics': parser.get_diagnostics(),
+        'valid': parser.is_valid(),
+    }
+
 class ASTAwareMerger:
     """Merge modular headers using AST validation"""
     
-    def __init__(self, modules_dir: str, output_file: str):
+    def __init__(self, modules_dir: str, output_file: str, use_cache: bool = True,
+                 strict: bool = False):
         self.modules_dir = Path(modules_dir)
         self.output_file = Path(output_file)
+        self.strict = strict
         self.modules = []
+        self.parsed: Dict[Path, Dict] = {}
+        self.all_modules_valid = True
+        self.use_cache = use_cache
+        self.cache_dir = CACHE_DIR if use_cache else None
+        self.cache_salt = self._compute_cache_salt() if use_cache else b''
     
     def merge(self):
         """Merge with AST validation"""
@@ -27,233 +68,358 @@ class ASTAwareMerger:
         # Load modules in dependency order
         self._load_modules()
         
-        # Validate each module is well-formed
-        self._validate_modules()
+        # Parse and validate each module
+        self._parse_modules()
         
         # Merge in correct order
         merged_content = self._merge_modules()
         
-        # Validate merged result
-        self._validate_merged(merged_content)
+        # Validate merged result; a full re-parse is only needed when
+        # some module was already invalid or strict mode is requested
+        if self.strict or not self.all_modules_valid:
+            self._validate_merged(merged_content)
+        else:
+            self._quick_validate(merged_content)
         
         # Write output
         self._write_output(merged_content)
         
+        # Release per-module parse results
+        self.parsed.clear()
+        
         print("✓ Merge complete!")
     
     def _load_modules(self):
         """Load modules in dependency order from modules.txt"""
         modules_file = self.modules_dir / "modules.txt"
         
-        if not modules_file.exists():
+        try:
+            stat = modules_file.stat()
+        except FileNotFoundError:
             raise FileNotFoundError(f"modules.txt not found in {self.modules_dir}")
         
         # Read module order
+        entries = self._load_module_entries_cached(modules_file, stat)
+        
+        # Checked one by one so the filesystem resolves case, symlinks and
+        # relative entries exactly as it does when the module is read
+        for entry in entries:
+            module_path = self.modules_dir / entry
+            if module_path.is_file():
+                self.modules.append(module_path)
+            else:
+                print(f"Warning: Module {entry} not found, skipping")
+    
+    def _load_module_entries_cached(self, modules_file: Path, stat: os.stat_result) -> List[str]:
+        """Read module entries from modules.txt, reusing the last parse if unchanged"""
+        cache_file = self.modules_dir / MODULES_CACHE_NAME
+        key = (stat.st_mtime_ns, stat.st_size)
+        
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_key, entries = pickle.load(f)
+            if cached_key == key:
+                return entries
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            pass
+        
+        entries = []
         with open(modules_file, 'r') as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                module_path = self.modules_dir / line
-                if module_path.exists():
-                    self.modules.append(module_path)
-                else:
-                    print(f"Warning: Module {line} not found, skipping")
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    entries.append(line)
+        
+        try:
+            with open(cache_file, 'wb') as f:
+                pickle.dump((key, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Warning: Could not write {cache_file}: {e}")
+        
+        return entries
     
-    def _validate_modules(self):
-        """Parse each module to ensure it's valid C++"""
+    def _parse_modules(self):
+        """Parse every module in parallel and report whether it's valid C++"""
         print("Validating modules...")
         
+        results: Dict[Path, Dict] = {}
+        errors: Dict[Path, Exception] = {}
+        pending = []
         for module_path in self.modules:
-            try:
-                parser = CppASTParser(str(module_path))
-                
-                if not parser.is_valid():
-                    diagnostics = parser.get_diagnostics()
-                    print(f"Warning: {module_path} has diagnostics:")
-                    for diag in diagnostics:
-                        print(f"  {diag}")
-                else:
-                    print(f"✓ {module_path.name} is valid")
-                    
-            except Exception as e:
-                print(f"Error validating {module_path}: {e}")
+            cached = self._load_cached(module_path)
+            if cached is not None:
+                results[module_path] = cached
+            else:
+                pending.append(module_path)
+        
+        # libclang parsing is CPU-bound and each module is independent
+        if len(pending) > 1:
+            with ProcessPoolExecutor() as executor:
+                futures = {p: executor.submit(_parse_one, str(p), self.use_cache) for p in pending}
+                for module_path, future in futures.items():
+                    try:
+                        results[module_path] = future.result()
+                    except Exception as e:
+                        errors[module_path] = e
+        else:
+            for module_path in pending:
+                try:
+                    results[module_path] = _parse_one(str(module_path), self.use_cache)
+                except Exception as e:
+                    errors[module_path] = e
+        
+        for module_path in self.modules:
+            if module_path in errors:
+                print(f"Error validating {module_path}: {errors[module_path]}")
                 # Continue with merge - some modules might have minor issues
+                self.all_modules_valid = False
+                continue
+            
+            result = results[module_path]
+            self.parsed[module_path] = result
+            if module_path in pending:
+                self._store_cached(module_path, result)
+            
+            if not result['valid']:
+                self.all_modules_valid = False
+                print(f"Warning: {module_path} has diagnostics:")
+                for diag in result['diagnostics']:
+                    print(f"  {diag}")
+            else:
+                print(f"✓ {module_path.name} is valid")
     
     def _merge_modules(self) -> str:
         """Merge modules in dependency order"""
         print("Merging modules...")
         
         # Start with header comment
-        content = self._generate_header_comment()
+        parts: List[str] = [self._generate_header_comment()]
         
         # Extract and consolidate includes
-        all_includes = set()
-        all_defines = []
+        # Insertion-ordered, so includes follow modules.txt order
+        all_includes: Dict[str, None] = {}
+        all_defines: Dict[str, None] = {}
         namespace_content = []
-        macros = []
+        macros: Dict[str, None] = {}
         
         for module_path in self.modules:
             try:
-                parser = CppASTParser(str(module_path))
+                # Reuse the results parsed during validation
+                result = self.parsed[module_path]
                 
-                # Extract includes
-                includes = parser.extract_includes()
-                for include in includes:
-                    all_includes.add(include)
+                for include in result['includes']:
+                    all_includes.setdefault(include, None)
                 
-                # Extract defines from source
-                defines = self._extract_defines_from_file(module_path)
-                all_defines.extend(defines)
+                for define in result['defines']:
+                    all_defines.setdefault(define, None)
                 
-                # Extract namespace content
-                namespaces = parser.extract_namespaces()
-                if 'trace' in namespaces:
-                    namespace_content.append(namespaces['trace'])
+                if result['namespace'] is not None:
+                    namespace_content.append(result['namespace'])
                 
-                # Extract macros
-                module_macros = parser.extract_macros()
-                macros.extend(module_macros)
+                # Identical macros from several modules are emitted once
+                for macro in result['macros']:
+                    macros.setdefault(macro, None)
                 
             except Exception as e:
                 print(f"Warning: Error processing {module_path}: {e}")
                 # Fallback to text-based extraction
                 content_text = module_path.read_text(encoding='utf-8')
-                namespace_content.append(content_text)
+                namespace_content.append(self._strip_namespace_declarations(content_text))
         
         # Add includes
-        content += "#pragma once\n\n"
-        for include in sorted(all_includes):
-            if include.startswith('<') and include.endswith('>'):
-                content += f"#include {include}\n"
-            else:
-                content += f"#include <{include}>\n"
-        content += "\n"
+        parts.append("#pragma once\n\n")
+        for include in all_includes:
+            parts.append(f"#include {include}\n")
+        parts.append("\n")
         
         # Add defines
         for define in all_defines:
-            content += f"{define}\n"
-        content += "\n"
+            parts.append(f"{define}\n")
+        parts.append("\n")
         
         # Add single namespace
-        content += "// Single namespace\n"
-        content += "namespace trace {\n\n"
+        parts.append("// Single namespace\n")
+        parts.append("namespace trace {\n\n")
         
         for ns_content in namespace_content:
-            # Strip namespace declarations from content
-            cleaned_content = self._strip_namespace_declarations(ns_content)
-            content += cleaned_content + "\n"
+            parts.append(ns_content)
+            parts.append("\n")
         
-        content += "} // namespace trace\n\n"
+        parts.append("} // namespace trace\n\n")
         
         # Add macros
         for macro in macros:
-            content += f"{macro}\n"
+            parts.append(f"{macro}\n")
         
-        return content
+        return ''.join(parts)
     
-    def _extract_defines_from_file(self, file_path: Path) -> List[str]:
+    def _compute_cache_salt(self) -> bytes:
+        """Identify the libclang build and tool sources that produced a cache entry"""
+        salt = hashlib.sha256()
+        library = Path(clang.cindex.conf.get_filename())
+        salt.update(str(library).encode('utf-8'))
+        sources = [library, Path(__file__), Path(clang.cindex.__file__),
+                   Path(__file__).with_name('cpp_ast_parser.py')]
+        for source in sources:
+            try:
+                stat = source.stat()
+                salt.update(f"{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8'))
+            except OSError:
+                salt.update(b'missing')
+        return salt.digest()
+    
+    def _cache_file(self, module_path: Path) -> Optional[Path]:
+        """Cache entry for the current content of a module"""
+        if self.cache_dir is None:
+            return None
+        digest = hashlib.sha256(self.cache_salt + module_path.read_bytes()).hexdigest()
+        return self.cache_dir / f"{digest}.pkl"
+    
+    def _load_cached(self, module_path: Path) -> Optional[Dict]:
+        """Return a previous parse result if the module content is unchanged"""
+        cache_file = self._cache_file(module_path)
+        if cache_file is None:
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+    
+    def _store_cached(self, module_path: Path, result: Dict):
+        """Save a parse result for reuse by later merges"""
+        cache_file = self._cache_file(module_path)
+        if cache_file is None:
+            return
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Warning: Could not write AST cache {cache_file}: {e}")
+    
+    @staticmethod
+    def _extract_defines_from_file(file_path: Path) -> List[str]:
         """Extract #define directives from file"""
         defines = []
-        content = file_path.read_text(encoding='utf-8')
-        lines = content.splitlines()
+        data = file_path.read_bytes()
         
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
+        # Jump between directive lines only; the regex engine does the
+        # scanning over the whole buffer
+        pos = 0
+        while True:
+            match = DIRECTIVE_RE.search(data, pos)
+            if match is None:
+                break
+            directive = match.group(1)
+            pos = match.end()
             
             # Skip header guards
-            if line.startswith('#ifndef') and i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                if next_line.startswith('#define'):
-                    i = self._skip_to_endif(lines, i)
-                    continue
-            
-            # Skip #pragma once
-            if line == '#pragma once':
-                i += 1
+            if directive == b'ifndef' and GUARD_DEFINE_RE.match(data, pos + 1):
+                pos = ASTAwareMerger._skip_to_endif(data, pos)
                 continue
             
             # Extract #define directives
-            if line.startswith('#define'):
-                defines.append(line)
-            
-            i += 1
+            if directive == b'define':
+                defines.append(match.group(0).strip().decode('utf-8'))
         
         return defines
     
-    def _skip_to_endif(self, lines: List[str], start_idx: int) -> int:
-        """Skip to matching #endif"""
+    @staticmethod
+    def _skip_to_endif(data: bytes, pos: int) -> int:
+        """Return the offset just past the #endif matching an open #if"""
         depth = 1
-        i = start_idx + 1
-        
-        while i < len(lines) and depth > 0:
-            line = lines[i].strip()
-            if line.startswith('#if'):
-                depth += 1
-            elif line.startswith('#endif'):
+        for match in SKIP_CONDITIONAL_RE.finditer(data, pos):
+            if match.group(1) == b'endif':
                 depth -= 1
-            i += 1
-        
-        return i
+                if depth == 0:
+                    return match.end()
+            else:
+                depth += 1
+        return len(data)
     
     def _strip_namespace_declarations(self, content: str) -> str:
-        """Remove namespace trace { and } declarations from content"""
-        lines = content.splitlines()
-        result_lines = []
+        """Remove namespace trace { and } declarations from raw module text"""
+        # Runs of kept lines as (start, end) offsets into content
+        kept = []
+        run_start = None
+        pos = 0
+        length = len(content)
         
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
+        while pos < length:
+            newline = content.find('\n', pos)
+            line_end = length if newline == -1 else newline
             
-            # Skip namespace declarations
-            if line.startswith('namespace trace') and '{' in line:
-                i += 1
-                continue
-            elif line == 'namespace trace {' or line == 'namespace trace{':
-                i += 1
-                continue
-            elif line == '} // namespace trace' or line == '}':
-                i += 1
-                continue
+            # Only namespace openers and closing braces are ever dropped
+            drop = False
+            if content.find('namespace', pos, line_end) != -1 or content.find('}', pos, line_end) != -1:
+                stripped = content[pos:line_end].strip()
+                drop = ((stripped.startswith('namespace trace') and '{' in stripped) or
+                        stripped == '} // namespace trace' or stripped == '}')
+            
+            if drop:
+                if run_start is not None:
+                    kept.append((run_start, pos - 1))
+                    run_start = None
+            elif run_start is None:
+                run_start = pos
             
-            result_lines.append(lines[i])
-            i += 1
+            pos = line_end + 1
+        
+        if run_start is not None:
+            kept.append((run_start, min(pos - 1, length)))
+        
+        return '\n'.join(content[a:b] for a, b in kept)
+    
+    def _quick_validate(self, content: str):
+        """Cheap structural check of merged result built from valid modules"""
+        print("Checking merged result...")
+        
+        problems = []
+        open_braces = content.count('{')
+        close_braces = content.count('}')
+        if open_braces != close_braces:
+            problems.append(f"unbalanced braces ({open_braces} '{{' vs {close_braces} '}}')")
+        
+        conditionals = CONDITIONAL_RE.findall(content)
+        opened = sum(1 for directive in conditionals if directive != 'endif')
+        closed = len(conditionals) - opened
+        if opened != closed:
+            problems.append(f"unbalanced conditionals ({opened} #if vs {closed} #endif)")
         
-        return '\n'.join(result_lines)
+        if problems:
+            print("Warning: Merged header may be malformed (rerun with --strict for details):")
+            for problem in problems:
+                print(f"  {problem}")
+        else:
+            print("✓ Merged header is balanced")
     
     def _validate_merged(self, content: str):
         """Validate merged result by parsing it"""
         print("Validating merged result...")
         
-        # Write to temporary file for validation
-        temp_file = Path("temp_merged.hpp")
-        try:
-            temp_file.write_text(content, encoding='utf-8')
-            
-            parser = CppASTParser(str(temp_file))
-            
-            if parser.is_valid():
-                print("✓ Merged header is valid C++")
-            else:
-                diagnostics = parser.get_diagnostics()
-                print("Warning: Merged header has diagnostics:")
-                for diag in diagnostics:
-                    print(f"  {diag}")
-                    
-        finally:
-            if temp_file.exists():
-                temp_file.unlink()
+        # Parse in memory - nothing is written to disk
+        parser = CppASTParser("temp_merged.hpp", unsaved_content=content)
+        
+        if parser.is_valid():
+            print("✓ Merged header is valid C++")
+        else:
+            diagnostics = parser.get_diagnostics()
+            print("Warning: Merged header has diagnostics:")
+            for diag in diagnostics:
+                print(f"  {diag}")
     
     def _write_output(self, content: str):
         """Write merged content to output file"""
         self.output_file.parent.mkdir(parents=True, exist_ok=True)
-        self.output_file.write_text(content, encoding='utf-8')
+        
+        # Encode once for both the write and the size statistic
+        data = content.encode('utf-8')
+        self.output_file.write_bytes(data)
         
         # Print statistics
-        lines = len(content.splitlines())
-        size = len(content.encode('utf-8'))
+        lines = content.count('\n') + (1 if content and not content.endswith('\n') else 0)
+        size = len(data)
         print(f"Generated {self.output_file}")
         print(f"  Size: {size:,} bytes")
         print(f"  Lines: {lines:,}")
@@ -290,10 +456,13 @@ def main():
     parser = argparse.ArgumentParser(description='Merge modular headers using AST validation')
     parser.add_argument('--input', '-i', required=True, help='Input directory containing modular files')
     parser.add_argument('--output', '-o', required=True, help='Output path for merged header file')
+    parser.add_argument('--no-cache', action='store_true', help='Re-parse every module instead of using the AST cache')
+    parser.add_argument('--strict', action='store_true', help='Always validate the merged header with libclang')
     
     args = parser.parse_args()
     
-    merger = ASTAwareMerger(args.input, args.output)
+    merger = ASTAwareMerger(args.input, args.output, use_cache=not args.no_cache,
+                            strict=args.strict)
     merger.merge()
 
 if __name__ == "__main__":
@@ -7,7 +7,9 @@ create clean modular files manually based on the known correct structure.
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Tuple
 
 class CleanManualExtractor:
     """Create clean modular files manually"""
@@ -15,29 +17,35 @@ class CleanManualExtractor:
     def __init__(self, output_dir: str):
         self.output_dir = Path(output_dir)
         
-        # Create output directory structure
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        (self.output_dir / "types").mkdir(exist_ok=True)
-        (self.output_dir / "namespaces").mkdir(exist_ok=True)
+        # Files queued by create_* methods, written by _flush_files(). Outside
+        # extract_all() each file is written as soon as it is created.
+        self.pending_files: List[Tuple[str, str]] = []
+        self._batch_writes = False
     
     def extract_all(self):
         """Create all clean modular files"""
         print(f"Creating clean modular files in {self.output_dir}")
         
-        self.create_platform()
-        self.create_enums()
-        self.create_event()
-        self.create_config()
-        self.create_ring()
-        self.create_async_queue()
-        self.create_registry()
-        self.create_scope()
-        self.create_stats()
-        self.create_variables()
-        self.create_functions()
-        self.create_namespaces()
-        self.create_macros()
-        self.create_modules_txt()
+        # Queue every file and write them in one batch
+        self._batch_writes = True
+        try:
+            self.create_platform()
+            self.create_enums()
+            self.create_event()
+            self.create_config()
+            self.create_ring()
+            self.create_async_queue()
+            self.create_registry()
+            self.create_scope()
+            self.create_stats()
+            self.create_variables()
+            self.create_functions()
+            self.create_namespaces()
+            self.create_macros()
+            self.create_modules_txt()
+        finally:
+            self._batch_writes = False
+        self._flush_files()
         
         print("✓ Clean manual extraction complete!")
     
@@ -679,10 +687,23 @@ macros.hpp'''
         self._write_file("modules.txt", content)
     
     def _write_file(self, relative_path: str, content: str):
-        """Write content to file"""
-        file_path = self.output_dir / relative_path
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(content, encoding='utf-8')
+        """Write a file, or queue it while extract_all() batches writes"""
+        self.pending_files.append((relative_path, content))
+        if not self._batch_writes:
+            self._flush_files()
+    
+    def _flush_files(self):
+        """Write all queued files, creating each directory only once"""
+        files = [(self.output_dir / relative_path, content)
+                 for relative_path, content in self.pending_files]
+        self.pending_files = []
+        
+        for directory in {file_path.parent for file_path, _ in files}:
+            directory.mkdir(parents=True, exist_ok=True)
+        
+        # Writes are I/O bound, so threads overlap the syscall latency
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda item: item[0].write_text(item[1], encoding='utf-8'), files))
 
 def main():
     """Main entry point"""
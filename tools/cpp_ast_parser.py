@@ -13,173 +13,358 @@ Parse C++ header files using clang AST for accurate extraction of:
 """
 
 import clang.cindex
+import gc
+import hashlib
+import os
+import pickle
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import re
 
+# Saved translation units, keyed by source content, clang args and libclang build
+TU_CACHE_DIR = Path.home() / ".cache" / "trace-scope" / "tu"
+
+# Preprocessor line patterns
+_INCLUDE_RE = re.compile(r'^[ \t]*#include[ \t]*(<[^>\n]+>|"[^"\n]+")', re.MULTILINE)
+# A whole #define, including backslash-continued lines
+_MACRO_RE = re.compile(r'^[ \t]*#define\b[^\\\n]*(?:\\[\s\S][^\\\n]*)*', re.MULTILINE)
+# An #ifndef immediately followed by a #define (header guard)
+_GUARD_RE = re.compile(r'^[ \t]*#ifndef[^\n]*\n[ \t]*#define', re.MULTILINE)
+_CONDITIONAL_RE = re.compile(r'^[ \t]*#(if|endif)', re.MULTILINE)
+_NEWLINE_RE = re.compile(rb'\n')
+# The inline specifier as a whole word, not part of an identifier
+_INLINE_RE = re.compile(r'\binline\b')
+
+# Headers are parsed as incomplete translation units: this skips end-of-TU
+# work such as pending template instantiation and the "#pragma once in main
+# file" warning. Function bodies are still parsed because the extractors
+# slice function text from cursor extents, which end at the declarator
+# when bodies are skipped.
+_PARSE_OPTIONS = clang.cindex.TranslationUnit.PARSE_INCOMPLETE
+
+# Arguments for every parse; part of the TU cache key
+_CLANG_ARGS = ('-x', 'c++', '-std=c++17')
+
+# FileInclusion attribute naming the included file; it depends only on the
+# libclang bindings in use, so it is looked up once per process
+_INCLUDE_ATTR: Optional[str] = None
+
+def _include_attr(inclusion) -> Optional[str]:
+    """Return 'include' (newer bindings), 'name' (older ones) or None"""
+    global _INCLUDE_ATTR
+    if _INCLUDE_ATTR is None:
+        # In newer libclang versions, use include.include instead of include.name
+        for attr in ('include', 'name'):
+            if hasattr(inclusion, attr):
+                _INCLUDE_ATTR = attr
+                break
+    return _INCLUDE_ATTR
+
+# Cursors that may directly contain namespace declarations
+_NAMESPACE_CONTAINER_KINDS = (
+    clang.cindex.CursorKind.LINKAGE_SPEC,
+    clang.cindex.CursorKind.UNEXPOSED_DECL,
+)
+
 class CppASTParser:
     """Parse C++ header files using clang AST"""
     
-    def __init__(self, file_path: str):
-        """Initialize parser with file path"""
-        self.file_path = Path(file_path)
-        self.index = clang.cindex.Index.create()
+    # One libclang index shared by every parser, created on first use
+    _shared_index: Optional[clang.cindex.Index] = None
+    
+    def __init__(self, file_path: str, unsaved_content: Optional[str] = None,
+                 use_cache: bool = True):
+        """Initialize parser with file path
         
-        # Parse with preprocessor definitions
-        args = ['-x', 'c++', '-std=c++17']
-        self.tu = self.index.parse(str(self.file_path), args=args)
+        If unsaved_content is given it is parsed in memory under file_path,
+        and the file does not need to exist on disk. Otherwise the parsed
+        translation unit is saved under TU_CACHE_DIR and reloaded on later
+        runs while the source is unchanged, unless use_cache is False.
+        """
+        self.file_path = Path(file_path)
+        self.index = self._get_index()
         
         # Read source content for text extraction
-        self.source_content = self.file_path.read_text(encoding='utf-8')
-        self.source_lines = self.source_content.splitlines(keepends=True)
+        if unsaved_content is not None:
+            self.source_content = unsaved_content
+        else:
+            self.source_content = self.file_path.read_text(encoding='utf-8')
+        
+        cache_key = None
+        if use_cache and unsaved_content is None:
+            cache_key = self._tu_cache_key()
+        
+        self.tu = None
+        if cache_key is not None:
+            self.tu, self._diagnostics = self._load_cached_tu(cache_key)
+        
+        if self.tu is None:
+            unsaved_files = None
+            if unsaved_content is not None:
+                unsaved_files = [(str(self.file_path), unsaved_content)]
+            self.tu = self.index.parse(str(self.file_path), args=_CLANG_ARGS,
+                                       unsaved_files=unsaved_files, options=_PARSE_OPTIONS)
+            # Saved ASTs do not keep diagnostics, so they are stored separately
+            self._diagnostics = [(diag.severity, diag.spelling) for diag in self.tu.diagnostics]
+            if cache_key is not None:
+                self._save_cached_tu(cache_key)
+        
+        # libclang columns are byte offsets, so cursor text is sliced from
+        # the encoded source using the byte offset of each line start
+        self._source_bytes = self.source_content.encode('utf-8')
+        self._line_starts = [0]
+        self._line_starts.extend(match.end() for match in _NEWLINE_RE.finditer(self._source_bytes))
+        
+        # Cursor index, built on first use by _build_cursor_index()
+        self._cursor_index: Optional[Dict[Tuple[Optional[str], clang.cindex.CursorKind], List]] = None
+        self._namespace_children: Dict[Optional[str], List] = {}
+        self._namespace_cursors: List = []
+        
+        # Whether a file name reported by libclang is this file, by name
+        self._own_file_names: Dict[str, bool] = {}
+        
+        # (macros, defines) from scan_preprocessor(), computed on first use
+        self._preprocessor: Optional[Tuple[List[str], List[str]]] = None
+        
+        # Source text already sliced out, keyed by (line, column) range
+        self._content_cache: Dict[Tuple[int, int, int, int], str] = {}
     
     def extract_includes(self) -> List[str]:
-        """Extract all #include directives"""
+        """Extract all #include directives, each wrapped in <> or quotes"""
         includes = []
-        for include in self.tu.get_includes():
-            # In newer libclang versions, use include.include instead of include.name
-            if hasattr(include, 'include'):
-                includes.append(include.include.name)
-            elif hasattr(include, 'name'):
-                includes.append(include.name)
-            else:
-                # Fallback: extract from source text
-                includes.extend(self._extract_includes_from_source())
+        # A reloaded translation unit reports inclusions in a different
+        # order than a fresh parse, so order them by nesting depth and
+        # position to keep the result independent of the TU cache
+        inclusions = sorted(self.tu.get_includes(),
+                            key=lambda inc: (inc.depth, inc.location.file.name, inc.location.line))
+        if not inclusions:
+            return includes
+        
+        attr = _include_attr(inclusions[0])
+        if attr is None:
+            # Fallback: extract from source text
+            return self._extract_includes_from_source()
+        if attr == 'include':
+            includes = [f"<{include.include.name}>" for include in inclusions]
+        else:
+            includes = [f"<{include.name}>" for include in inclusions]
         return includes
     
     def _extract_includes_from_source(self) -> List[str]:
         """Extract includes using regex as fallback"""
-        includes = []
-        lines = self.source_content.splitlines()
-        for line in lines:
-            line = line.strip()
-            if line.startswith('#include'):
-                # Extract the include name
-                match = re.match(r'#include\s*[<"]([^>"]+)[>"]', line)
-                if match:
-                    includes.append(match.group(1))
-        return includes
+        # The include name with its delimiters, straight from the source
+        # text without splitting it into lines
+        return [match.group(1) for match in _INCLUDE_RE.finditer(self.source_content)]
     
     def extract_namespaces(self) -> Dict[str, str]:
         """Extract namespace content by name"""
+        self._build_cursor_index()
         namespaces = {}
-        for cursor in self.tu.cursor.walk_preorder():
-            if cursor.kind == clang.cindex.CursorKind.NAMESPACE:
-                name = cursor.spelling
-                content = self._extract_cursor_content(cursor)
-                namespaces[name] = content
+        for cursor in self._namespace_cursors:
+            name = cursor.spelling
+            content = self._extract_cursor_content(cursor)
+            namespaces[name] = content
         return namespaces
     
+    def extract_namespace_body(self, name: str) -> Optional[str]:
+        """Extract the text between the braces of a top-level namespace.
+        
+        Multiple blocks of the same namespace are concatenated in source order.
+        Returns None if the file does not declare the namespace.
+        """
+        bodies = []
+        for cursor in self.tu.cursor.get_children():
+            if (cursor.kind == clang.cindex.CursorKind.NAMESPACE and
+                cursor.spelling == name and
+                self._is_own_cursor(cursor)):
+                content = self._extract_cursor_content(cursor)
+                open_brace = content.find('{')
+                close_brace = content.rfind('}')
+                if open_brace != -1 and close_brace > open_brace:
+                    bodies.append(content[open_brace + 1:close_brace])
+        
+        if not bodies:
+            return None
+        return ''.join(bodies)
+    
     def extract_functions(self, namespace: str = None) -> List[Dict]:
         """Extract function definitions"""
-        functions = []
-        for cursor in self._find_namespace(namespace):
-            if cursor.kind == clang.cindex.CursorKind.FUNCTION_DECL:
-                func_info = {
-                    'name': cursor.spelling,
-                    'return_type': cursor.result_type.spelling if cursor.result_type else '',
-                    'content': self._extract_cursor_content(cursor),
-                    'location': cursor.location,
-                    'is_inline': self._is_inline_function(cursor)
-                }
-                functions.append(func_info)
-        return functions
+        return [self._function_info(cursor)
+                for cursor in self._cursors_of_kind(namespace, clang.cindex.CursorKind.FUNCTION_DECL)]
     
     def extract_structs(self, namespace: str = None) -> List[Dict]:
         """Extract struct/class definitions"""
         structs = []
         for cursor in self._find_namespace(namespace):
             if cursor.kind in [clang.cindex.CursorKind.STRUCT_DECL, clang.cindex.CursorKind.CLASS_DECL]:
-                struct_info = {
-                    'name': cursor.spelling,
-                    'kind': 'struct' if cursor.kind == clang.cindex.CursorKind.STRUCT_DECL else 'class',
-                    'content': self._extract_cursor_content(cursor),
-                    'location': cursor.location,
-                    'fields': self._extract_struct_fields(cursor)
-                }
-                structs.append(struct_info)
+                structs.append(self._struct_info(cursor))
         return structs
     
     def extract_enums(self, namespace: str = None) -> List[Dict]:
         """Extract enum definitions"""
-        enums = []
-        for cursor in self._find_namespace(namespace):
-            if cursor.kind == clang.cindex.CursorKind.ENUM_DECL:
-                enum_info = {
-                    'name': cursor.spelling,
-                    'content': self._extract_cursor_content(cursor),
-                    'location': cursor.location,
-                    'values': self._extract_enum_values(cursor)
-                }
-                enums.append(enum_info)
-        return enums
+        return [self._enum_info(cursor)
+                for cursor in self._cursors_of_kind(namespace, clang.cindex.CursorKind.ENUM_DECL)]
     
     def extract_variables(self, namespace: str = None) -> List[Dict]:
         """Extract variable declarations"""
-        variables = []
+        return [self._variable_info(cursor)
+                for cursor in self._cursors_of_kind(namespace, clang.cindex.CursorKind.VAR_DECL)]
+    
+    def extract_everything(self, namespace: str = 'trace') -> Dict[str, List]:
+        """Extract functions, structs, enums and variables of a namespace in one pass
+        
+        Returns a dict with those four lists (same contents as the individual
+        extract_* methods) plus 'includes', 'namespaces' and 'macros'.
+        """
+        builders = {
+            clang.cindex.CursorKind.FUNCTION_DECL: ('functions', self._function_info),
+            clang.cindex.CursorKind.STRUCT_DECL: ('structs', self._struct_info),
+            clang.cindex.CursorKind.CLASS_DECL: ('structs', self._struct_info),
+            clang.cindex.CursorKind.ENUM_DECL: ('enums', self._enum_info),
+            clang.cindex.CursorKind.VAR_DECL: ('variables', self._variable_info),
+        }
+        result = {'functions': [], 'structs': [], 'enums': [], 'variables': []}
+        
         for cursor in self._find_namespace(namespace):
-            if cursor.kind == clang.cindex.CursorKind.VAR_DECL:
-                var_info = {
-                    'name': cursor.spelling,
-                    'type': cursor.type.spelling if cursor.type else '',
-                    'content': self._extract_cursor_content(cursor),
-                    'location': cursor.location,
-                    'is_static': cursor.storage_class == clang.cindex.StorageClass.STATIC
-                }
-                variables.append(var_info)
-        return variables
+            builder = builders.get(cursor.kind)
+            if builder is not None:
+                category, build = builder
+                result[category].append(build(cursor))
+        
+        result['includes'] = self.extract_includes()
+        result['namespaces'] = self.extract_namespaces()
+        result['macros'] = self.extract_macros()
+        return result
+    
+    def _function_info(self, cursor) -> Dict:
+        """Describe a FUNCTION_DECL cursor"""
+        return {
+            'name': cursor.spelling,
+            'return_type': cursor.result_type.spelling if cursor.result_type else '',
+            'content': self._extract_cursor_content(cursor),
+            'location': cursor.location,
+            'is_inline': self._is_inline_function(cursor)
+        }
+    
+    def _struct_info(self, cursor) -> Dict:
+        """Describe a STRUCT_DECL/CLASS_DECL cursor"""
+        return {
+            'name': cursor.spelling,
+            'kind': 'struct' if cursor.kind == clang.cindex.CursorKind.STRUCT_DECL else 'class',
+            'content': self._extract_cursor_content(cursor),
+            'location': cursor.location,
+            'fields': self._extract_struct_fields(cursor)
+        }
+    
+    def _enum_info(self, cursor) -> Dict:
+        """Describe an ENUM_DECL cursor"""
+        return {
+            'name': cursor.spelling,
+            'content': self._extract_cursor_content(cursor),
+            'location': cursor.location,
+            'values': self._extract_enum_values(cursor)
+        }
+    
+    def _variable_info(self, cursor) -> Dict:
+        """Describe a VAR_DECL cursor"""
+        return {
+            'name': cursor.spelling,
+            'type': cursor.type.spelling if cursor.type else '',
+            'content': self._extract_cursor_content(cursor),
+            'location': cursor.location,
+            'is_static': cursor.storage_class == clang.cindex.StorageClass.STATIC
+        }
     
     def extract_macros(self) -> List[str]:
         """Extract macro definitions using regex (preprocessor directives)"""
+        macros, _ = self.scan_preprocessor()
+        return list(macros)
+    
+    def scan_preprocessor(self) -> Tuple[List[str], List[str]]:
+        """Scan the #define directives outside header guards once
+        
+        Returns (macros, defines): each macro is a whole directive including
+        continuation lines, each define is the directive's first line.
+        """
+        if self._preprocessor is not None:
+            return self._preprocessor
+        
+        content = self.source_content
+        
+        # Header-guarded regions are skipped entirely
+        guarded = []
+        end = 0
+        for guard in _GUARD_RE.finditer(content):
+            if guard.start() >= end:
+                end = self._skip_to_endif(content, guard.end())
+                guarded.append((guard.start(), end))
+        
         macros = []
-        lines = self.source_content.splitlines()
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Skip header guards
-            if line.startswith('#ifndef') and i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                if next_line.startswith('#define'):
-                    i = self._skip_to_endif(lines, i)
-                    continue
-            
-            # Skip #pragma once
-            if line == '#pragma once':
-                i += 1
+        defines = []
+        region = 0
+        for match in _MACRO_RE.finditer(content):
+            start = match.start()
+            while region < len(guarded) and guarded[region][1] <= start:
+                region += 1
+            if region < len(guarded) and guarded[region][0] <= start:
                 continue
-            
-            # Extract macro definitions
-            if line.startswith('#define'):
-                macro_lines = [line]
-                j = i + 1
-                
-                # Handle multi-line macros
-                while j < len(lines) and lines[j].rstrip().endswith('\\'):
-                    macro_lines.append(lines[j])
-                    j += 1
-                
-                macros.append('\n'.join(macro_lines))
-                i = j
-            else:
-                i += 1
+            macro = match.group().strip()
+            macros.append(macro)
+            defines.append(macro.split('\n', 1)[0].rstrip())
         
-        return macros
+        self._preprocessor = (macros, defines)
+        return self._preprocessor
+    
+    def _build_cursor_index(self):
+        """Index namespaces and their children with a single walk of the TU"""
+        if self._cursor_index is not None:
+            return
+        self._cursor_index = {}
+        self._index_scope(self.tu.cursor, None)
+    
+    def _index_scope(self, scope, namespace: Optional[str], record: bool = True):
+        """Record the children of a scope and descend into nested namespaces"""
+        # Declarations pulled in from other headers are never extracted,
+        # so they are dropped here instead of being walked and indexed
+        children = [child for child in scope.get_children() if self._is_own_cursor(child)]
+        if record:
+            # A namespace reopened later in the file (namespace trace { ... }
+            # closed and opened again) is merged into the first block
+            self._namespace_children.setdefault(namespace, []).extend(children)
+            for child in children:
+                self._cursor_index.setdefault((namespace, child.kind), []).append(child)
+        
+        for child in children:
+            if child.kind == clang.cindex.CursorKind.NAMESPACE:
+                self._namespace_cursors.append(child)
+                self._index_scope(child, child.spelling)
+            elif child.kind in _NAMESPACE_CONTAINER_KINDS:
+                # extern "C++" { ... } blocks can hold namespaces too
+                self._index_scope(child, None, record=False)
+    
+    def _is_own_cursor(self, cursor) -> bool:
+        """Whether a cursor is located in the parsed file itself"""
+        source_file = cursor.location.file
+        if source_file is None:
+            return False
+        name = source_file.name
+        own = self._own_file_names.get(name)
+        if own is None:
+            # A translation unit loaded from the cache reports absolute file
+            # names, so compare normalized paths rather than the spelling
+            own = os.path.abspath(name) == os.path.abspath(self.file_path)
+            self._own_file_names[name] = own
+        return own
+    
+    def _cursors_of_kind(self, namespace: Optional[str], kind) -> List:
+        """Direct children of a namespace (or the TU) with the given kind"""
+        self._build_cursor_index()
+        return self._cursor_index.get((namespace, kind), [])
     
     def _find_namespace(self, namespace: str = None):
         """Find cursors within a specific namespace"""
-        if namespace is None:
-            # Return all cursors at translation unit level
-            return self.tu.cursor.get_children()
-        
-        # Find the specific namespace
-        for cursor in self.tu.cursor.walk_preorder():
-            if (cursor.kind == clang.cindex.CursorKind.NAMESPACE and 
-                cursor.spelling == namespace):
-                return cursor.get_children()
-        
-        return []
+        self._build_cursor_index()
+        return self._namespace_children.get(namespace, [])
     
     def _extract_cursor_content(self, cursor) -> str:
         """Get the actual source text for a cursor"""
@@ -187,36 +372,48 @@ class CppASTParser:
         end = cursor.extent.end
         
         if start.file and end.file and start.file.name == end.file.name:
-            # Extract text from the file
-            start_line = start.line - 1  # Convert to 0-based
-            end_line = end.line - 1
-            
-            if start_line < len(self.source_lines) and end_line < len(self.source_lines):
-                # Get the lines
-                lines = self.source_lines[start_line:end_line + 1]
-                
-                # Adjust for column positions
-                if start_line == end_line:
-                    # Single line - extract from start.column to end.column
-                    line = lines[0]
-                    start_col = start.column - 1  # Convert to 0-based
-                    end_col = end.column - 1
-                    return line[start_col:end_col]
-                else:
-                    # Multiple lines
-                    if lines:
-                        # Adjust first line
-                        lines[0] = lines[0][start.column - 1:]
-                        # Adjust last line
-                        lines[-1] = lines[-1][:end.column - 1]
-                    return ''.join(lines)
+            return self._extract_range(start.line, start.column, end.line, end.column)
         
         return ""
     
+    def _extract_range(self, start_line: int, start_column: int,
+                       end_line: int, end_column: int) -> str:
+        """Get source text between two 1-based positions, memoized per range"""
+        key = (start_line, start_column, end_line, end_column)
+        cached = self._content_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        content = ""
+        start_line -= 1  # Convert to 0-based
+        end_line -= 1
+        
+        line_starts = self._line_starts
+        if start_line < len(line_starts) and end_line < len(line_starts):
+            # Columns past the end of a line stop at its end, newline included
+            start = line_starts[start_line]
+            start = min(start + start_column - 1, self._line_end(start_line))
+            end = line_starts[end_line]
+            end = min(end + end_column - 1, self._line_end(end_line))
+            content = self._source_bytes[start:end].decode('utf-8', errors='replace')
+        
+        self._content_cache[key] = content
+        return content
+    
+    def _line_end(self, line: int) -> int:
+        """Byte offset just past the end of a 0-based line"""
+        if line + 1 < len(self._line_starts):
+            return self._line_starts[line + 1]
+        return len(self._source_bytes)
+    
     def _is_inline_function(self, cursor) -> bool:
         """Check if function is inline"""
-        content = self._extract_cursor_content(cursor)
-        return 'inline' in content
+        # Only the declaration head before the function name can hold
+        # the specifier; the body is never sliced
+        start = cursor.extent.start
+        name = cursor.location
+        head = self._extract_range(start.line, start.column, name.line, name.column)
+        return _INLINE_RE.search(head) is not None
     
     def _extract_struct_fields(self, cursor) -> List[Dict]:
         """Extract fields from struct/class"""
@@ -239,34 +436,97 @@ class CppASTParser:
                 values.append(child.spelling)
         return values
     
-    def _skip_to_endif(self, lines: List[str], start_idx: int) -> int:
-        """Skip to matching #endif"""
+    def _skip_to_endif(self, content: str, pos: int) -> int:
+        """Offset just past the #endif matching an already-open conditional"""
         depth = 1
-        i = start_idx + 1
-        
-        while i < len(lines) and depth > 0:
-            line = lines[i].strip()
-            if line.startswith('#if'):
-                depth += 1
-            elif line.startswith('#endif'):
+        for directive in _CONDITIONAL_RE.finditer(content, pos):
+            if directive.group(1) == 'endif':
                 depth -= 1
-            i += 1
+                if depth == 0:
+                    return directive.end()
+            else:
+                depth += 1
+        return len(content)
+    
+    def release(self):
+        """Free the translation unit once no more AST queries are needed
         
-        return i
+        Cursors keep their translation unit alive, so the cursor index is
+        dropped too. Text-based results (source, macros, diagnostics) stay
+        usable; 'location' values in earlier results must not be read.
+        """
+        self.tu = None
+        self._cursor_index = None
+        self._namespace_children = {}
+        self._namespace_cursors = []
+        gc.collect()
     
     def get_diagnostics(self) -> List[str]:
         """Get parsing diagnostics"""
         diagnostics = []
-        for diag in self.tu.diagnostics:
-            diagnostics.append(f"{diag.severity}: {diag.spelling}")
+        for severity, spelling in self._diagnostics:
+            diagnostics.append(f"{severity}: {spelling}")
         return diagnostics
     
     def is_valid(self) -> bool:
         """Check if the parsed file is valid C++"""
-        for diag in self.tu.diagnostics:
-            if diag.severity >= clang.cindex.Diagnostic.Error:
+        for severity, _ in self._diagnostics:
+            if severity >= clang.cindex.Diagnostic.Error:
                 return False
         return True
+    
+    @classmethod
+    def _get_index(cls) -> clang.cindex.Index:
+        """Return the shared libclang index, creating it on first use"""
+        if cls._shared_index is None:
+            cls._shared_index = clang.cindex.Index.create()
+        return cls._shared_index
+    
+    def _tu_cache_key(self) -> str:
+        """Hash of everything that determines the parsed translation unit"""
+        key = hashlib.sha256()
+        key.update(str(self.file_path.resolve()).encode('utf-8'))
+        key.update(b'\0'.join(arg.encode('utf-8') for arg in _CLANG_ARGS))
+        key.update(str(_PARSE_OPTIONS).encode('utf-8'))
+        library = Path(clang.cindex.conf.get_filename())
+        key.update(str(library).encode('utf-8'))
+        try:
+            key.update(str(library.stat().st_mtime_ns).encode('utf-8'))
+        except OSError:
+            pass
+        key.update(self.source_content.encode('utf-8'))
+        return key.hexdigest()
+    
+    def _load_cached_tu(self, cache_key: str):
+        """Load a saved translation unit and its diagnostics, or (None, None)"""
+        ast_file = TU_CACHE_DIR / f"{cache_key}.ast"
+        diag_file = TU_CACHE_DIR / f"{cache_key}.diag"
+        try:
+            with open(diag_file, 'rb') as f:
+                diagnostics = pickle.load(f)
+            # libclang refuses ASTs whose inputs changed since they were saved
+            tu = clang.cindex.TranslationUnit.from_ast_file(str(ast_file), index=self.index)
+        except (OSError, pickle.PickleError, EOFError,
+                clang.cindex.TranslationUnitLoadError):
+            return None, None
+        return tu, diagnostics
+    
+    def _save_cached_tu(self, cache_key: str):
+        """Save the translation unit for later runs; failures are not fatal"""
+        ast_file = TU_CACHE_DIR / f"{cache_key}.ast"
+        diag_file = TU_CACHE_DIR / f"{cache_key}.diag"
+        try:
+            TU_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write to temporary names first so concurrent readers never
+            # see a partial file
+            tmp_suffix = f".{os.getpid()}.tmp"
+            self.tu.save(str(ast_file) + tmp_suffix)
+            with open(str(diag_file) + tmp_suffix, 'wb') as f:
+                pickle.dump(self._diagnostics, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(str(ast_file) + tmp_suffix, ast_file)
+            os.replace(str(diag_file) + tmp_suffix, diag_file)
+        except (OSError, clang.cindex.TranslationUnitSaveError) as e:
+            print(f"Warning: Could not cache translation unit for {self.file_path}: {e}")
 
 def test_parser():
     """Test the AST parser with a simple example"""
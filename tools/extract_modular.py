@@ -7,55 +7,101 @@ for accurate extraction of namespaces, functions, structs, enums, etc.
 """
 
 import argparse
+import getpass
+import os
+import socket
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 from cpp_ast_parser import CppASTParser
 
+# Socket and authentication key of --daemon / --client, kept in a directory
+# only the user can access; the key is regenerated on every daemon start
+DAEMON_SOCKET_NAME = "extract.sock"
+DAEMON_AUTHKEY_NAME = "authkey"
+
+# Parsed inputs the daemon keeps in memory, least recently used evicted first
+DAEMON_MAX_PARSERS = 4
+
+# Header guard and file comment opening every generated header
+_PROLOGUE = (
+    "#ifndef {guard}\n"
+    "#define {guard}\n\n"
+    "/**\n"
+    " * @file {filename}\n"
+    " * @brief {description}\n"
+    " * \n"
+    " * Generated from trace_scope_original.hpp using AST extraction\n"
+    " */\n\n"
+)
+
 class ModularExtractor:
     """Extract modular headers from monolithic header"""
     
-    def __init__(self, source_file: str, output_dir: str):
+    def __init__(self, source_file: str, output_dir: str, use_cache: bool = True,
+                 parser: Optional[CppASTParser] = None):
         self.source_file = Path(source_file)
         self.output_dir = Path(output_dir)
-        self.parser = CppASTParser(str(self.source_file))
+        # A parser passed in is owned by the caller and may be reused
+        self._owns_parser = parser is None
+        self.parser = parser or CppASTParser(str(self.source_file), use_cache=use_cache)
         
         # Create output directory structure
         self.output_dir.mkdir(parents=True, exist_ok=True)
         (self.output_dir / "types").mkdir(exist_ok=True)
         (self.output_dir / "namespaces").mkdir(exist_ok=True)
+        
+        # Directories known to exist, so _write_file() creates each only once
+        self._created_dirs: Set[Path] = {
+            self.output_dir, self.output_dir / "types", self.output_dir / "namespaces"
+        }
     
     def extract_all(self):
         """Extract all components to modular structure"""
         print(f"Extracting from {self.source_file} to {self.output_dir}")
         
+        # Collect everything from the AST in a single pass
+        extracted = self.parser.extract_everything(namespace="trace")
+        self.parser.scan_preprocessor()
+        
+        # Everything below works on extracted text, so the translation unit
+        # can go before the headers are generated and written
+        if self._owns_parser:
+            self.parser.release()
+        
         # Extract platform-specific content
-        self.extract_platform()
+        self.extract_platform(extracted['includes'])
         
         # Extract types
-        self.extract_enums()
-        self.extract_structs()
+        self.extract_enums(extracted['enums'])
+        self.extract_structs(extracted['structs'])
         
         # Extract functions and variables
-        self.extract_functions()
-        self.extract_variables()
+        self.extract_functions(extracted['functions'])
+        self.extract_variables(extracted['variables'])
         
         # Extract namespaces
-        self.extract_namespaces()
+        self.extract_namespaces(extracted['namespaces'])
         
         # Extract macros
-        self.extract_macros()
+        self.extract_macros(extracted['macros'])
         
         # Generate modules.txt
         self.generate_modules_txt()
         
         print("✓ Extraction complete!")
     
-    def extract_platform(self):
+    def extract_platform(self, includes: Optional[List[str]] = None):
         """Extract platform includes and defines"""
         print("Extracting platform content...")
         
         # Extract includes
-        includes = self.parser.extract_includes()
+        if includes is None:
+            includes = self.parser.extract_includes()
         
         # Extract defines from source (preprocessor directives)
         defines = self._extract_defines_from_source()
@@ -69,11 +115,12 @@ class ModularExtractor:
         
         self._write_file("platform.hpp", content)
     
-    def extract_enums(self):
+    def extract_enums(self, enums: Optional[List[Dict]] = None):
         """Extract enums to types/enums.hpp"""
         print("Extracting enums...")
         
-        enums = self.parser.extract_enums(namespace="trace")
+        if enums is None:
+            enums = self.parser.extract_enums(namespace="trace")
         
         if enums:
             content = self._generate_header(
@@ -85,12 +132,14 @@ class ModularExtractor:
         else:
             print("  No enums found in trace namespace")
     
-    def extract_structs(self):
+    def extract_structs(self, structs: Optional[List[Dict]] = None):
         """Extract each struct to its own file"""
         print("Extracting structs...")
         
-        structs = self.parser.extract_structs(namespace="trace")
+        if structs is None:
+            structs = self.parser.extract_structs(namespace="trace")
         
+        files = []
         for struct in structs:
             filename = f"{struct['name'].lower()}.hpp"
             content = self._generate_header(
@@ -98,14 +147,17 @@ class ModularExtractor:
                 f"{struct['name']} struct definition",
                 structs=[struct]
             )
-            self._write_file(f"types/{filename}", content)
+            files.append((f"types/{filename}", content))
             print(f"  Extracted {struct['name']} -> types/{filename}")
+        
+        self._write_files(files)
     
-    def extract_functions(self):
+    def extract_functions(self, functions: Optional[List[Dict]] = None):
         """Extract functions to functions.hpp"""
         print("Extracting functions...")
         
-        functions = self.parser.extract_functions(namespace="trace")
+        if functions is None:
+            functions = self.parser.extract_functions(namespace="trace")
         
         if functions:
             content = self._generate_header(
@@ -118,11 +170,12 @@ class ModularExtractor:
         else:
             print("  No functions found in trace namespace")
     
-    def extract_variables(self):
+    def extract_variables(self, variables: Optional[List[Dict]] = None):
         """Extract variables to variables.hpp"""
         print("Extracting variables...")
         
-        variables = self.parser.extract_variables(namespace="trace")
+        if variables is None:
+            variables = self.parser.extract_variables(namespace="trace")
         
         if variables:
             content = self._generate_header(
@@ -135,12 +188,14 @@ class ModularExtractor:
         else:
             print("  No variables found in trace namespace")
     
-    def extract_namespaces(self):
+    def extract_namespaces(self, namespaces: Optional[Dict[str, str]] = None):
         """Extract nested namespaces to separate files"""
         print("Extracting namespaces...")
         
-        namespaces = self.parser.extract_namespaces()
+        if namespaces is None:
+            namespaces = self.parser.extract_namespaces()
         
+        files = []
         for name, content in namespaces.items():
             if name == "trace":
                 continue  # Skip main namespace
@@ -151,14 +206,17 @@ class ModularExtractor:
                 f"namespace {name}",
                 namespace_content=content
             )
-            self._write_file(f"namespaces/{filename}", header_content)
+            files.append((f"namespaces/{filename}", header_content))
             print(f"  Extracted namespace {name} -> namespaces/{filename}")
+        
+        self._write_files(files)
     
-    def extract_macros(self):
+    def extract_macros(self, macros: Optional[List[str]] = None):
         """Extract macros to macros.hpp"""
         print("Extracting macros...")
         
-        macros = self.parser.extract_macros()
+        if macros is None:
+            macros = self.parser.extract_macros()
         
         if macros:
             content = self._generate_header(
@@ -207,134 +265,231 @@ class ModularExtractor:
     
     def _extract_defines_from_source(self) -> List[str]:
         """Extract #define directives from source"""
-        defines = []
-        lines = self.parser.source_content.splitlines()
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Skip header guards
-            if line.startswith('#ifndef') and i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                if next_line.startswith('#define'):
-                    i = self._skip_to_endif(lines, i)
-                    continue
-            
-            # Skip #pragma once
-            if line == '#pragma once':
-                i += 1
-                continue
-            
-            # Extract #define directives
-            if line.startswith('#define'):
-                defines.append(line)
-            
-            i += 1
-        
-        return defines
-    
-    def _skip_to_endif(self, lines: List[str], start_idx: int) -> int:
-        """Skip to matching #endif"""
-        depth = 1
-        i = start_idx + 1
-        
-        while i < len(lines) and depth > 0:
-            line = lines[i].strip()
-            if line.startswith('#if'):
-                depth += 1
-            elif line.startswith('#endif'):
-                depth -= 1
-            i += 1
-        
-        return i
+        # Shares the parser's single preprocessor scan with extract_macros()
+        _, defines = self.parser.scan_preprocessor()
+        return list(defines)
     
     def _generate_header(self, filename: str, description: str, **kwargs) -> str:
         """Generate header file content"""
         guard_name = filename.upper().replace('.', '_').replace('/', '_')
         
-        content = f"#ifndef {guard_name}\n"
-        content += f"#define {guard_name}\n\n"
-        content += f"/**\n"
-        content += f" * @file {filename}\n"
-        content += f" * @brief {description}\n"
-        content += f" * \n"
-        content += f" * Generated from trace_scope_original.hpp using AST extraction\n"
-        content += f" */\n\n"
+        parts = [_PROLOGUE.format(guard=guard_name, filename=filename, description=description)]
         
         # Add includes if needed
         if 'includes' in kwargs:
             for include in kwargs['includes']:
-                if include.startswith('<') and include.endswith('>'):
-                    content += f"#include {include}\n"
-                else:
-                    content += f"#include <{include}>\n"
-            content += "\n"
+                parts.append(f"#include {include}\n")
+            parts.append("\n")
         
         # Add defines
         if 'defines' in kwargs:
             for define in kwargs['defines']:
-                content += f"{define}\n"
-            content += "\n"
+                parts.append(f"{define}\n")
+            parts.append("\n")
         
         # Add namespace content
         if 'namespace_content' in kwargs:
-            content += "namespace trace {\n\n"
-            content += kwargs['namespace_content']
-            content += "\n} // namespace trace\n\n"
-        
-        # Add enums
-        if 'enums' in kwargs:
-            content += "namespace trace {\n\n"
-            for enum in kwargs['enums']:
-                content += enum['content'] + "\n\n"
-            content += "} // namespace trace\n\n"
-        
-        # Add structs
-        if 'structs' in kwargs:
-            content += "namespace trace {\n\n"
-            for struct in kwargs['structs']:
-                content += struct['content'] + "\n\n"
-            content += "} // namespace trace\n\n"
-        
-        # Add functions
-        if 'functions' in kwargs:
-            content += "namespace trace {\n\n"
-            for func in kwargs['functions']:
-                content += func['content'] + "\n\n"
-            content += "} // namespace trace\n\n"
-        
-        # Add variables
-        if 'variables' in kwargs:
-            content += "namespace trace {\n\n"
-            for var in kwargs['variables']:
-                content += var['content'] + "\n\n"
-            content += "} // namespace trace\n\n"
+            parts.append("namespace trace {\n\n")
+            parts.append(kwargs['namespace_content'])
+            parts.append("\n} // namespace trace\n\n")
+        
+        # Add enums, structs, functions and variables, each in its own block
+        for kind in ('enums', 'structs', 'functions', 'variables'):
+            if kind in kwargs:
+                parts.append("namespace trace {\n\n")
+                for item in kwargs[kind]:
+                    parts.append(item['content'])
+                    parts.append("\n\n")
+                parts.append("} // namespace trace\n\n")
         
         # Add macros
         if 'macros' in kwargs:
             for macro in kwargs['macros']:
-                content += macro + "\n"
+                parts.append(macro)
+                parts.append("\n")
         
-        content += f"\n#endif // {guard_name}\n"
+        parts.append(f"\n#endif // {guard_name}\n")
         
-        return content
+        return ''.join(parts)
     
     def _write_file(self, relative_path: str, content: str):
         """Write content to file"""
         file_path = self.output_dir / relative_path
-        file_path.parent.mkdir(parents=True, exist_ok=True)
+        if file_path.parent not in self._created_dirs:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(file_path.parent)
         file_path.write_text(content, encoding='utf-8')
+    
+    def _write_files(self, files: List[Tuple[str, str]]):
+        """Write several (relative_path, content) pairs concurrently"""
+        # A path listed twice keeps its last content, as sequential writes would
+        files = dict(files)
+        
+        # Writes are I/O bound, so threads overlap the syscall latency
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda item: self._write_file(*item), files.items()))
+
+def _daemon_dir() -> Path:
+    """Private per-user directory holding the daemon socket and key"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    base = Path(runtime_dir) if runtime_dir else Path.home() / ".cache"
+    directory = base / "trace-scope" / "daemon"
+    directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+    
+    if sys.platform != 'win32':
+        # mkdir's mode is subject to the umask, and the directory may predate it
+        stat = directory.stat()
+        if stat.st_uid != os.getuid():
+            raise PermissionError(f"{directory} is not owned by the current user")
+        if stat.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+    
+    return directory
+
+def _daemon_address(directory: Path) -> str:
+    """Address the daemon listens on: a Unix socket, or a named pipe on Windows"""
+    if sys.platform == 'win32':
+        return rf'\\.\pipe\trace-scope-extract-{getpass.getuser()}'
+    return str(directory / DAEMON_SOCKET_NAME)
+
+def _new_authkey(directory: Path) -> bytes:
+    """Generate a random key and store it where only the user can read it"""
+    authkey = os.urandom(32)
+    key_file = directory / DAEMON_AUTHKEY_NAME
+    tmp_file = directory / f"{DAEMON_AUTHKEY_NAME}.{os.getpid()}.tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.write(fd, authkey)
+    finally:
+        os.close(fd)
+    os.replace(tmp_file, key_file)
+    return authkey
+
+def _remove_stale_socket(address: str):
+    """Remove a socket left behind by a daemon that is no longer running"""
+    if sys.platform == 'win32' or not os.path.exists(address):
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(address)
+    except ConnectionRefusedError:
+        os.unlink(address)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"An extraction daemon is already listening on {address}")
+
+def serve(use_cache: bool = True):
+    """Keep parsed inputs in memory and run extractions requested by clients
+    
+    Each request is a dict with 'input' and 'output' paths. An input is
+    re-parsed only when its modification time changes.
+    """
+    parsers = OrderedDict()  # input path -> (mtime_ns, CppASTParser)
+    
+    directory = _daemon_dir()
+    address = _daemon_address(directory)
+    _remove_stale_socket(address)
+    authkey = _new_authkey(directory)
+    key_file = directory / DAEMON_AUTHKEY_NAME
+    
+    # Clients take a missing key to mean no daemon is running
+    try:
+        with Listener(address, authkey=authkey) as listener:
+            print(f"Extraction daemon listening on {address}")
+            while True:
+                # A client that fails authentication or drops out must not take
+                # the daemon down with it
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    print(f"Warning: Rejected connection: {e}")
+                    continue
+                
+                with conn:
+                    try:
+                        request = conn.recv()
+                    except Exception as e:
+                        print(f"Warning: Could not read request: {e}")
+                        continue
+                    
+                    try:
+                        source_file = request['input']
+                        mtime = Path(source_file).stat().st_mtime_ns
+                        cached = parsers.get(source_file)
+                        if cached is None or cached[0] != mtime:
+                            cached = (mtime, CppASTParser(source_file, use_cache=use_cache))
+                            parsers[source_file] = cached
+                        parsers.move_to_end(source_file)
+                        while len(parsers) > DAEMON_MAX_PARSERS:
+                            parsers.popitem(last=False)
+                        
+                        extractor = ModularExtractor(source_file, request['output'], parser=cached[1])
+                        extractor.extract_all()
+                        reply = {'ok': True}
+                    except Exception as e:
+                        print(f"Error: {e}")
+                        reply = {'ok': False, 'error': str(e)}
+                    
+                    try:
+                        conn.send(reply)
+                    except OSError as e:
+                        print(f"Warning: Could not send reply: {e}")
+    finally:
+        try:
+            key_file.unlink()
+        except OSError:
+            pass
+
+def request_extraction(source_file: str, output_dir: str) -> bool:
+    """Ask a running daemon to extract source_file into output_dir"""
+    # The daemon may run from another directory
+    request = {'input': str(Path(source_file).resolve()),
+               'output': str(Path(output_dir).resolve())}
+    
+    # A key or socket left behind by a daemon that was killed counts as none
+    directory = _daemon_dir()
+    try:
+        authkey = (directory / DAEMON_AUTHKEY_NAME).read_bytes()
+        conn = Client(_daemon_address(directory), authkey=authkey)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("Error: No extraction daemon is running (start one with --daemon)")
+        return False
+    
+    with conn:
+        conn.send(request)
+        reply = conn.recv()
+    
+    if reply['ok']:
+        print(f"✓ Extracted {source_file} to {output_dir} (daemon)")
+    else:
+        print(f"Error: {reply['error']}")
+    return reply['ok']
 
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(description='Extract modular headers from monolithic header')
-    parser.add_argument('--input', '-i', required=True, help='Input monolithic header file')
-    parser.add_argument('--output', '-o', required=True, help='Output directory for modular files')
+    parser.add_argument('--input', '-i', help='Input monolithic header file')
+    parser.add_argument('--output', '-o', help='Output directory for modular files')
+    parser.add_argument('--no-cache', action='store_true', help='Re-parse the input instead of loading a cached translation unit')
+    parser.add_argument('--daemon', action='store_true', help='Keep parsed inputs in memory and serve extraction requests')
+    parser.add_argument('--client', action='store_true', help='Send the extraction to a running --daemon')
     
     args = parser.parse_args()
     
-    extractor = ModularExtractor(args.input, args.output)
+    if args.daemon:
+        serve(use_cache=not args.no_cache)
+        return
+    
+    if not args.input or not args.output:
+        parser.error('--input and --output are required')
+    
+    if args.client:
+        if not request_extraction(args.input, args.output):
+            raise SystemExit(1)
+        return
+    
+    extractor = ModularExtractor(args.input, args.output, use_cache=not args.no_cache)
     extractor.extract_all()
 
 if __name__ == "__main__":
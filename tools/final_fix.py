@@ -12,45 +12,73 @@ This tool addresses all the remaining compilation errors identified:
 """
 
 import argparse
+import re
+from bisect import bisect_right
+from itertools import accumulate
 from pathlib import Path
 from typing import Dict, List
 
+from fix_cache import FixCache
+
+_BRACE_RE = re.compile(r'[{}]')
+
+# Leftover localtime_s calls whose surrounding code was dropped
+_ORPHAN_RE = re.compile(r'localtime_s\(&(?:tm_buf|tm), &time_t_val\);')
+
+# Function heads that lost their opening brace
+_DECLARATION_FIXES = {
+    'inline AsyncQueue& async_queue()': 'inline AsyncQueue& async_queue() {',
+    'inline Config& get_config()': 'inline Config& get_config() {',
+    'inline void flush_current_thread()': 'inline void flush_current_thread() {',
+}
+_DECLARATION_RE = re.compile('|'.join(map(re.escape, _DECLARATION_FIXES)))
+
+# Directives opening (#if, #ifdef, #ifndef) or closing a conditional block
+_CONDITIONAL_RE = re.compile(r'\s*#\s*(if|endif)')
+
 class FinalFixer:
     """Comprehensive fix for all compilation errors"""
     
-    def __init__(self, header_file: str):
+    def __init__(self, header_file: str, use_cache: bool = True):
         self.header_file = Path(header_file)
+        self.fix_cache = FixCache(__file__, enabled=use_cache)
     
     def fix_all_errors(self):
         """Apply all fixes to resolve compilation errors"""
         print(f"Applying comprehensive fixes to {self.header_file}")
         
-        content = self.header_file.read_text(encoding='utf-8')
+        if self.fix_cache.is_fixed([self.header_file]):
+            print("✓ Already fixed, nothing changed since the last run")
+            return
+        
+        # Split once; every fix works on the same list of lines
+        lines = self.header_file.read_text(encoding='utf-8').splitlines()
         
         # Fix 1: Add missing includes
-        content = self._add_missing_includes(content)
+        lines = self._add_missing_includes(lines)
         
         # Fix 2: Add missing defines
-        content = self._add_missing_defines(content)
+        lines = self._add_missing_defines(lines)
         
         # Fix 3: Remove orphaned code fragments
-        content = self._remove_orphaned_code(content)
+        lines = self._remove_orphaned_code(lines)
         
         # Fix 4: Fix enum values
-        content = self._fix_enum_values(content)
+        lines = self._fix_enum_values(lines)
         
         # Fix 5: Fix function declarations
-        content = self._fix_function_declarations(content)
+        lines = self._fix_function_declarations(lines)
         
         # Fix 6: Add missing function implementations
-        content = self._add_missing_implementations(content)
+        lines = self._add_missing_implementations(lines)
         
         # Write the fixed content
-        self.header_file.write_text(content, encoding='utf-8')
+        self.header_file.write_bytes('\n'.join(lines).encode('utf-8'))
+        self.fix_cache.record([self.header_file])
         
         print("✓ All compilation errors fixed!")
     
-    def _add_missing_includes(self, content: str) -> str:
+    def _add_missing_includes(self, lines: List[str]) -> List[str]:
         """Add missing standard library includes"""
         print("  Adding missing includes...")
         
@@ -61,23 +89,16 @@ class FinalFixer:
             "#include <memory>"
         ]
         
-        # Find the end of the includes section
-        lines = content.splitlines()
-        include_end = 0
+        existing = {line.strip() for line in lines if line.strip().startswith('#include')}
         
-        for i, line in enumerate(lines):
-            if line.strip().startswith('#include'):
-                include_end = i
+        # Insert missing includes after the include block, shifting the rest once
+        to_insert = [include for include in missing_includes if include not in existing]
+        include_end = self._preamble_end(lines)
+        lines[include_end:include_end] = to_insert
         
-        # Insert missing includes
-        for include in missing_includes:
-            if include not in content:
-                lines.insert(include_end + 1, include)
-                include_end += 1
-        
-        return '\n'.join(lines)
+        return lines
     
-    def _add_missing_defines(self, content: str) -> str:
+    def _add_missing_defines(self, lines: List[str]) -> List[str]:
         """Add missing preprocessor defines"""
         print("  Adding missing defines...")
         
@@ -87,70 +108,110 @@ class FinalFixer:
             "#define TRC_RING_CAP 1024"
         ]
         
-        # Find the defines section
-        lines = content.splitlines()
-        defines_start = 0
+        # Find the defines section, or put one right after the includes
+        defines_start = None
         
         for i, line in enumerate(lines):
             if line.strip().startswith('#define TRC_'):
                 defines_start = i
                 break
         
-        # Insert missing defines
-        for define in missing_defines:
-            if define.split()[1] not in content:
-                lines.insert(defines_start, define)
-                defines_start += 1
+        if defines_start is None:
+            defines_start = self._preamble_end(lines)
+        
+        # Names of the macros the header already defines
+        existing = set()
+        for line in lines:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == '#define':
+                existing.add(parts[1])
+        
+        # Insert missing defines, all in one slice assignment
+        lines[defines_start:defines_start] = [
+            define for define in missing_defines if define.split()[1] not in existing
+        ]
+        
+        return lines
+    
+    def _preamble_end(self, lines: List[str]) -> int:
+        """Index just past the include block, or past #pragma once or the guard
+        
+        The include block ends at the first line of code after it. An include
+        inside a conditional block (platform headers) ends it only at the
+        #endif, so nothing is inserted into a single branch.
+        """
+        includes = []  # (line index, conditional depth)
+        closes = []  # (line index, depth after the #endif)
+        depth = 0
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if includes and stripped and not stripped.startswith(('#', '//', '/*', '*')):
+                break
+            
+            match = _CONDITIONAL_RE.match(line)
+            if match and match.group(1) == 'if':
+                depth += 1
+            elif match:
+                depth -= 1
+                closes.append((i, depth))
+            elif stripped.startswith('#include'):
+                includes.append((i, depth))
+        
+        if includes:
+            # A header guard puts every include one level deep
+            base = min(include_depth for _, include_depth in includes)
+            last, last_depth = includes[-1]
+            if last_depth == base:
+                return last + 1
+            block_ends = (i + 1 for i, close_depth in closes if i > last and close_depth <= base)
+            return next(block_ends, last + 1)
         
-        return '\n'.join(lines)
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped == '#pragma once':
+                return i + 1
+            next_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+            if stripped.startswith('#ifndef') and next_line.startswith('#define'):
+                return i + 2
+        return 0
     
-    def _remove_orphaned_code(self, content: str) -> str:
+    def _remove_orphaned_code(self, lines: List[str]) -> List[str]:
         """Remove orphaned code fragments"""
         print("  Removing orphaned code...")
         
-        lines = content.splitlines()
-        new_lines = []
+        # One C-level scan of the whole header decides whether any line
+        # needs to go; usually none does and the lines are returned as-is
+        if not _ORPHAN_RE.search('\n'.join(lines)):
+            return lines
         
-        for line in lines:
-            # Remove orphaned localtime_s calls
-            if 'localtime_s(&tm_buf, &time_t_val);' in line:
-                continue
-            if 'localtime_s(&tm, &time_t_val);' in line:
-                continue
-            
-            new_lines.append(line)
-        
-        return '\n'.join(new_lines)
+        # Remove orphaned localtime_s calls
+        return [line for line in lines if not _ORPHAN_RE.search(line)]
     
-    def _fix_enum_values(self, content: str) -> str:
+    def _fix_enum_values(self, lines: List[str]) -> List[str]:
         """Fix missing enum values"""
         print("  Fixing enum values...")
         
-        # Fix SharedMemoryMode enum
-        content = content.replace(
-            'enum class SharedMemoryMode : uint8_t {',
-            'enum class SharedMemoryMode : uint8_t {\n    Disabled = 0,\n    Enabled = 1,'
-        )
+        # Fix SharedMemoryMode enum; the added values stay in the opener's
+        # list entry, which the final join turns into separate lines
+        opener = 'enum class SharedMemoryMode : uint8_t {'
+        for i, line in enumerate(lines):
+            if opener in line:
+                lines[i] = line.replace(opener, opener + '\n    Disabled = 0,\n    Enabled = 1,')
         
-        return content
+        return lines
     
-    def _fix_function_declarations(self, content: str) -> str:
+    def _fix_function_declarations(self, lines: List[str]) -> List[str]:
         """Fix function declaration syntax errors"""
         print("  Fixing function declarations...")
         
         # Fix function declarations that are missing semicolons
-        fixes = [
-            ('inline AsyncQueue& async_queue()', 'inline AsyncQueue& async_queue() {'),
-            ('inline Config& get_config()', 'inline Config& get_config() {'),
-            ('inline void flush_current_thread()', 'inline void flush_current_thread() {')
-        ]
-        
-        for old, new in fixes:
-            content = content.replace(old, new)
+        for i, line in enumerate(lines):
+            if 'inline' in line:
+                lines[i] = _DECLARATION_RE.sub(lambda m: _DECLARATION_FIXES[m.group(0)], line)
         
-        return content
+        return lines
     
-    def _add_missing_implementations(self, content: str) -> str:
+    def _add_missing_implementations(self, lines: List[str]) -> List[str]:
         """Add missing function implementations"""
         print("  Adding missing implementations...")
         
@@ -173,7 +234,6 @@ class FinalFixer:
         ]
         
         # Find the namespace trace section and add implementations
-        lines = content.splitlines()
         namespace_start = -1
         
         for i, line in enumerate(lines):
@@ -182,35 +242,51 @@ class FinalFixer:
                 break
         
         if namespace_start != -1:
-            # Find the end of the namespace
-            namespace_end = -1
-            brace_count = 0
-            for i in range(namespace_start, len(lines)):
-                line = lines[i]
-                if '{' in line:
-                    brace_count += line.count('{')
-                if '}' in line:
-                    brace_count -= line.count('}')
+            # The namespace conventionally ends with a commented closing
+            # brace near the end of the file, so look for that from the back
+            namespace_end = next(
+                (i for i in range(len(lines) - 1, namespace_start, -1)
+                 if lines[i].startswith('} // namespace trace')),
+                -1
+            )
+            
+            if namespace_end == -1:
+                # Find the end of the namespace by walking only the braces
+                tail = lines[namespace_start:]
+                text = '\n'.join(tail)
+                brace_count = 0
+                for brace in _BRACE_RE.finditer(text):
+                    brace_count += 1 if brace.group() == '{' else -1
                     if brace_count == 0:
-                        namespace_end = i
+                        # Map the offset back to its entry in lines
+                        line_ends = list(accumulate(len(line) + 1 for line in tail))
+                        namespace_end = namespace_start + bisect_right(line_ends, brace.start())
                         break
             
             if namespace_end != -1:
+                # Skip functions the header already defines, qualified or not
+                names = {impl.split('(', 1)[0].split()[-1].split('::')[-1]: impl
+                         for impl in missing_implementations}
+                defined_re = re.compile(
+                    r'\binline\b[^(;]*?\b(' + '|'.join(map(re.escape, names)) + r')\s*\('
+                )
+                defined = {match.group(1) for match in defined_re.finditer('\n'.join(lines))}
+                missing_implementations = [impl for name, impl in names.items() if name not in defined]
+                
                 # Insert implementations before the closing brace
-                for impl in missing_implementations:
-                    lines.insert(namespace_end, impl)
-                    namespace_end += 1
+                lines[namespace_end:namespace_end] = missing_implementations
         
-        return '\n'.join(lines)
+        return lines
 
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(description='Apply comprehensive fixes to header file')
     parser.add_argument('--header', '-f', required=True, help='Path to header file to fix')
+    parser.add_argument('--no-cache', action='store_true', help='Apply the fixes even if the file is already fixed')
     
     args = parser.parse_args()
     
-    fixer = FinalFixer(args.header)
+    fixer = FinalFixer(args.header, use_cache=not args.no_cache)
     fixer.fix_all_errors()
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+fix_cache.py - Remember files already brought to their fixed state
+
+The fix tools rewrite files in place, and applying the same fixes twice is
+wasted work at best (some renames, e.g. func -> function, are not even
+idempotent). After a run a tool records the stat and digest of every file
+it produced; a later run whose files still match skips the fixes entirely.
+
+Entries are tied to the exact version of the tool that wrote them.
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Shared by all fix tools, next to the other trace-scope caches
+CACHE_FILE = Path.home() / ".cache" / "trace-scope" / "fixed.pkl"
+
+class FixCache:
+    """Stat and digest of files as a fix tool last left them"""
+    
+    def __init__(self, tool_file: str, enabled: bool = True):
+        self.enabled = enabled
+        
+        # A changed tool may fix differently, so it gets fresh entries
+        stat = os.stat(tool_file)
+        self.tool = (str(Path(tool_file).resolve()), stat.st_mtime_ns, stat.st_size)
+        
+        self._entries: Dict[Tuple, Optional[Tuple[int, int, str]]] = {}
+        if enabled:
+            self._entries = self._read()
+    
+    def is_fixed(self, paths: List[Path]) -> bool:
+        """True if every path is exactly as this tool last left it"""
+        if not self.enabled:
+            return False
+        
+        for path in paths:
+            key = self._key(path)
+            if key not in self._entries:
+                return False
+            
+            entry = self._entries[key]
+            if entry is None:
+                # The tool left this file absent
+                if path.exists():
+                    return False
+                continue
+            
+            # The stat rules out most changes; the digest catches edits
+            # within the filesystem's timestamp resolution
+            try:
+                stat = path.stat()
+            except OSError:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) != entry[:2]:
+                return False
+            if self._digest(path) != entry[2]:
+                return False
+        
+        return True
+    
+    def record(self, paths: List[Path]):
+        """Remember the current state of paths and save the cache"""
+        if not self.enabled:
+            return
+        
+        # Entries of older versions of this tool can never match again
+        self._entries = {key: entry for key, entry in self._entries.items()
+                         if key[0][0] != self.tool[0] or key[0] == self.tool}
+        
+        for path in paths:
+            try:
+                stat = path.stat()
+                entry = (stat.st_mtime_ns, stat.st_size, self._digest(path))
+            except OSError:
+                entry = None
+            self._entries[self._key(path)] = entry
+        
+        self._write()
+    
+    def _key(self, path: Path) -> Tuple:
+        return (self.tool, str(path.resolve()))
+    
+    @staticmethod
+    def _digest(path: Path) -> str:
+        return hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+    
+    def _read(self) -> Dict:
+        try:
+            with open(CACHE_FILE, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return {}
+    
+    def _write(self):
+        # Written to a temporary file first so a reader never sees a partial cache
+        tmp_file = CACHE_FILE.with_name(f"{CACHE_FILE.name}.{os.getpid()}.tmp")
+        try:
+            CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(self._entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, CACHE_FILE)
+        except OSError as e:
+            print(f"Warning: Could not write fix cache {CACHE_FILE}: {e}")
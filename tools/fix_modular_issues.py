@@ -15,33 +15,181 @@ The approach is surgical - fix only what's broken, don't rebuild everything.
 """
 
 import argparse
+import mmap
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Pattern
+
+from fix_cache import FixCache
+
+# Functions added to functions.hpp when missing, paired with their names
+_MISSING_FUNCTIONS = [(func.split(b'(')[0].split()[-1], func) for func in [
+    b'''inline void set_external_state(Config* cfg, Registry* reg) {
+    if (cfg) {
+        dll_shared_state::set_shared_config(cfg);
+    }
+    if (reg) {
+        dll_shared_state::set_shared_registry(reg);
+    }
+}''',
+    b'''inline bool load_config(const std::string& path) {
+    return get_config().load_from_file(path);
+}''',
+    b'''inline void dump_stats() {
+    // Dump statistics to output
+    // Implementation would go here
+}''',
+    b'''inline void filter_include_function(const std::string& func) {
+    get_config().filter_include_functions.push_back(func);
+}''',
+    b'''inline void filter_exclude_function(const std::string& func) {
+    get_config().filter_exclude_functions.push_back(func);
+}''',
+    b'''inline void filter_include_file(const std::string& file) {
+    get_config().filter_include_files.push_back(file);
+}''',
+    b'''inline void filter_exclude_file(const std::string& file) {
+    get_config().filter_exclude_files.push_back(file);
+}''',
+    b'''inline void filter_set_max_depth(uint32_t depth) {
+    get_config().filter_max_depth = depth;
+}''',
+    b'''inline void filter_clear() {
+    get_config().filter_include_functions.clear();
+    get_config().filter_exclude_functions.clear();
+    get_config().filter_include_files.clear();
+    get_config().filter_exclude_files.clear();
+}''',
+    b'''inline void flush_immediate_queue() {
+    async_queue().flush_now();
+}''',
+    b'''inline void start_async_immediate() {
+    async_queue().start();
+}''',
+    b'''inline void stop_async_immediate() {
+    async_queue().stop();
+}''',
+    b'''inline void ensure_stats_registered() {
+    if (!stats_registered.load()) {
+        stats_registered.store(true);
+        // Register with stats system
+    }
+}''',
+    b'''inline std::string generate_dump_filename(const char* prefix = nullptr) {
+    // Generate filename for dump
+    return "trace_dump.bin";
+}''',
+    b'''inline std::string dump_binary(const char* prefix = nullptr) {
+    // Dump binary trace data
+    return "trace_dump.bin";
+}'''
+]]
+
+# Any inline definition or declaration of one of the functions above, so one
+# walk over functions.hpp finds them all; call sites lack the 'inline'
+_MISSING_FUNCTION_RE = re.compile(
+    rb'\binline\b[^(]{0,200}?\b('
+    + b'|'.join(re.escape(name) for name, _ in _MISSING_FUNCTIONS)
+    + rb')\s*\('
+)
+
+# Functions that can end up defined twice in functions.hpp
+_DUPLICATE_RE = re.compile(rb'\s*inline\s+std::string\s+(generate_dump_filename|dump_binary)\s*\(')
+
+# Braces outside // comments and string/character literals; comments and
+# literals are matched as whole tokens so the braces inside them are skipped
+_BRACE_TOKEN_RE = re.compile(rb'//.*|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[{}]')
+
+def _literal_alternation(keys) -> Pattern:
+    """Compile literal keys into one alternation, longest first
+    
+    Ordering by length lets a key win over any shorter key that is its
+    prefix, whatever order the mapping lists them in.
+    """
+    return re.compile(b'|'.join(re.escape(key) for key in sorted(keys, key=len, reverse=True)))
+
+# Field renames, each applied in a single pass over the file
+_EVENT_FIELD_MAP = {
+    b'ts_ns': b'timestamp',
+    b'func': b'function',
+}
+_EVENT_FIELD_RE = _literal_alternation(_EVENT_FIELD_MAP)
+
+_RING_FIELD_MAP = {
+    b'buf[][]': b'buffers[]',
+    b'count[]': b'counts[]',
+    b'head[]': b'heads[]',
+}
+_RING_FIELD_RE = _literal_alternation(_RING_FIELD_MAP)
+
+_CONFIG_FIELD_MAP = {
+    b'filter.include_functions': b'filter_include_functions',
+    b'filter.exclude_functions': b'filter_exclude_functions',
+    b'filter.include_files': b'filter_include_files',
+    b'filter.exclude_files': b'filter_exclude_files',
+    b'filter.max_depth': b'filter_max_depth',
+    b'config.mode': b'config.tracing_mode',
+}
+_CONFIG_FIELD_RE = _literal_alternation(_CONFIG_FIELD_MAP)
 
 class ModularFixer:
     """Fix specific issues in modular header system"""
     
-    def __init__(self, modular_dir: str):
+    def __init__(self, modular_dir: str, use_cache: bool = True):
         self.modular_dir = Path(modular_dir)
+        self.fix_cache = FixCache(__file__, enabled=use_cache)
+        
+        # File contents read or produced so far, kept as bytes from read to
+        # write since every pattern here is ASCII, and the paths to write back
+        self._files: Dict[Path, bytes] = {}
+        self._dirty: List[Path] = []
     
     def fix_all_issues(self):
         """Apply all fixes to the modular system"""
         print(f"Fixing issues in {self.modular_dir}")
         
+        # Every file the fixes below may touch
+        fixed_files = [
+            self.modular_dir / "types" / "enums.hpp",
+            self.modular_dir / "types" / "event.hpp",
+            self.modular_dir / "types" / "ring.hpp",
+            self.modular_dir / "types" / "config.hpp",
+            self.modular_dir / "functions.hpp",
+            self.modular_dir / "namespaces" / "stats.hpp",
+            self.modular_dir / "namespaces" / "shared_memory.hpp",
+            self.modular_dir / "namespaces" / "dll_shared_state.hpp",
+        ]
+        if self.fix_cache.is_fixed(fixed_files):
+            print("✓ Already fixed, nothing changed since the last run")
+            return
+        
+        # Read the files the fixes edit up front, overlapping the reads
+        self._prefetch([
+            self.modular_dir / "types" / "event.hpp",
+            self.modular_dir / "types" / "ring.hpp",
+            self.modular_dir / "types" / "config.hpp",
+            self.modular_dir / "functions.hpp",
+        ])
+        
         # Fix 1: Add missing TracingMode::Disabled
         self.fix_missing_enum_values()
         
         # Fix 2: Fix struct field names
         self.fix_struct_field_names()
         
-        # Fix 3: Add missing functions
-        self.fix_missing_functions()
-        
-        # Fix 4: Add missing namespaces
+        # Fix 3: Add missing namespaces
         self.fix_missing_namespaces()
         
-        # Fix 5: Remove duplicate definitions
-        self.fix_duplicate_definitions()
+        # Fix 4: Add missing functions and remove duplicate definitions,
+        # both in one pass over functions.hpp
+        print("Fixing missing functions and duplicate definitions...")
+        self._rewrite_functions(add_missing=True, remove_duplicates=True)
+        
+        # Each changed file is written once, after all fixes
+        self._save_all()
+        self.fix_cache.record(fixed_files)
         
         print("✓ All fixes applied!")
     
@@ -51,15 +199,15 @@ class ModularFixer:
         
         enums_file = self.modular_dir / "types" / "enums.hpp"
         if enums_file.exists():
-            content = enums_file.read_text(encoding='utf-8')
-            
-            # Add Disabled to TracingMode if missing
-            if 'Disabled = 0' not in content:
+            # Add Disabled to TracingMode if missing; the file is only
+            # loaded when it actually needs the edit
+            if not self._file_contains(enums_file, b'Disabled = 0'):
+                content = self._load(enums_file)
                 content = content.replace(
-                    'enum class TracingMode : uint8_t {',
-                    'enum class TracingMode : uint8_t {\n    Disabled = 0,'
+                    b'enum class TracingMode : uint8_t {',
+                    b'enum class TracingMode : uint8_t {\n    Disabled = 0,'
                 )
-                enums_file.write_text(content, encoding='utf-8')
+                self._store(enums_file, content)
                 print("  ✓ Added TracingMode::Disabled")
     
     def fix_struct_field_names(self):
@@ -69,141 +217,53 @@ class ModularFixer:
         # Fix Event struct fields
         event_file = self.modular_dir / "types" / "event.hpp"
         if event_file.exists():
-            content = event_file.read_text(encoding='utf-8')
+            content = self._load(event_file)
             
             # Replace field names to match original
-            content = content.replace('ts_ns', 'timestamp')
-            content = content.replace('func', 'function')
+            content = _EVENT_FIELD_RE.sub(lambda m: _EVENT_FIELD_MAP[m.group(0)], content)
             
-            event_file.write_text(content, encoding='utf-8')
+            self._store(event_file, content)
             print("  ✓ Fixed Event struct field names")
         
         # Fix Ring struct fields
         ring_file = self.modular_dir / "types" / "ring.hpp"
         if ring_file.exists():
-            content = ring_file.read_text(encoding='utf-8')
+            content = self._load(ring_file)
             
             # Add missing fields
-            if 'thread_id' not in content:
+            if b'thread_id' not in content:
                 content = content.replace(
-                    'uint32_t depth = 0;',
-                    'uint32_t depth = 0;\n    uint32_t thread_id = 0;'
+                    b'uint32_t depth = 0;',
+                    b'uint32_t depth = 0;\n    uint32_t thread_id = 0;'
                 )
             
-            if 'thread_name' not in content:
+            if b'thread_name' not in content:
                 content = content.replace(
-                    'uint32_t thread_id = 0;',
-                    'uint32_t thread_id = 0;\n    std::string thread_name;'
+                    b'uint32_t thread_id = 0;',
+                    b'uint32_t thread_id = 0;\n    std::string thread_name;'
                 )
             
             # Fix array field names
-            content = content.replace('buf[][]', 'buffers[]')
-            content = content.replace('count[]', 'counts[]')
-            content = content.replace('head[]', 'heads[]')
+            content = _RING_FIELD_RE.sub(lambda m: _RING_FIELD_MAP[m.group(0)], content)
             
-            ring_file.write_text(content, encoding='utf-8')
+            self._store(ring_file, content)
             print("  ✓ Fixed Ring struct field names")
         
         # Fix Config struct fields
         config_file = self.modular_dir / "types" / "config.hpp"
         if config_file.exists():
-            content = config_file.read_text(encoding='utf-8')
-            
-            # Fix filter field names
-            content = content.replace('filter.include_functions', 'filter_include_functions')
-            content = content.replace('filter.exclude_functions', 'filter_exclude_functions')
-            content = content.replace('filter.include_files', 'filter_include_files')
-            content = content.replace('filter.exclude_files', 'filter_exclude_files')
-            content = content.replace('filter.max_depth', 'filter_max_depth')
+            content = self._load(config_file)
             
-            # Fix mode field name
-            content = content.replace('config.mode', 'config.tracing_mode')
+            # Fix filter field names and the mode field name
+            content = _CONFIG_FIELD_RE.sub(lambda m: _CONFIG_FIELD_MAP[m.group(0)], content)
             
-            config_file.write_text(content, encoding='utf-8')
+            self._store(config_file, content)
             print("  ✓ Fixed Config struct field names")
     
     def fix_missing_functions(self):
         """Add missing function implementations"""
         print("Fixing missing functions...")
-        
-        functions_file = self.modular_dir / "functions.hpp"
-        if functions_file.exists():
-            content = functions_file.read_text(encoding='utf-8')
-            
-            # Add missing functions if not present
-            missing_functions = [
-                '''inline void set_external_state(Config* cfg, Registry* reg) {
-    if (cfg) {
-        dll_shared_state::set_shared_config(cfg);
-    }
-    if (reg) {
-        dll_shared_state::set_shared_registry(reg);
-    }
-}''',
-                '''inline bool load_config(const std::string& path) {
-    return get_config().load_from_file(path);
-}''',
-                '''inline void dump_stats() {
-    // Dump statistics to output
-    // Implementation would go here
-}''',
-                '''inline void filter_include_function(const std::string& func) {
-    get_config().filter_include_functions.push_back(func);
-}''',
-                '''inline void filter_exclude_function(const std::string& func) {
-    get_config().filter_exclude_functions.push_back(func);
-}''',
-                '''inline void filter_include_file(const std::string& file) {
-    get_config().filter_include_files.push_back(file);
-}''',
-                '''inline void filter_exclude_file(const std::string& file) {
-    get_config().filter_exclude_files.push_back(file);
-}''',
-                '''inline void filter_set_max_depth(uint32_t depth) {
-    get_config().filter_max_depth = depth;
-}''',
-                '''inline void filter_clear() {
-    get_config().filter_include_functions.clear();
-    get_config().filter_exclude_functions.clear();
-    get_config().filter_include_files.clear();
-    get_config().filter_exclude_files.clear();
-}''',
-                '''inline void flush_immediate_queue() {
-    async_queue().flush_now();
-}''',
-                '''inline void start_async_immediate() {
-    async_queue().start();
-}''',
-                '''inline void stop_async_immediate() {
-    async_queue().stop();
-}''',
-                '''inline void ensure_stats_registered() {
-    if (!stats_registered.load()) {
-        stats_registered.store(true);
-        // Register with stats system
-    }
-}''',
-                '''inline std::string generate_dump_filename(const char* prefix = nullptr) {
-    // Generate filename for dump
-    return "trace_dump.bin";
-}''',
-                '''inline std::string dump_binary(const char* prefix = nullptr) {
-    // Dump binary trace data
-    return "trace_dump.bin";
-}'''
-            ]
-            
-            for func in missing_functions:
-                func_name = func.split('(')[0].split()[-1]
-                if func_name not in content:
-                    # Add function before the closing namespace
-                    content = content.replace(
-                        '} // namespace trace',
-                        f'{func}\n\n}} // namespace trace'
-                    )
-            
-            functions_file.write_text(content, encoding='utf-8')
-            print("  ✓ Added missing functions")
+        self._rewrite_functions(add_missing=True, remove_duplicates=False)
     
     def fix_missing_namespaces(self):
         """Add missing namespace implementations"""
@@ -216,7 +276,7 @@ class ModularFixer:
         # Add stats namespace
         stats_file = namespaces_dir / "stats.hpp"
         if not stats_file.exists():
-            stats_content = '''#ifndef STATS_HPP
+            stats_content = b'''#ifndef STATS_HPP
 #define STATS_HPP
 
 namespace trace {
@@ -234,13 +294,13 @@ inline void register_thread(uint32_t thread_id, const std::string& name) {
 } // namespace trace
 
 #endif // STATS_HPP'''
-            stats_file.write_text(stats_content, encoding='utf-8')
+            self._store(stats_file, stats_content)
             print("  ✓ Added stats namespace")
         
         # Add shared_memory namespace
         shared_memory_file = namespaces_dir / "shared_memory.hpp"
         if not shared_memory_file.exists():
-            shared_memory_content = '''#ifndef SHARED_MEMORY_HPP
+            shared_memory_content = b'''#ifndef SHARED_MEMORY_HPP
 #define SHARED_MEMORY_HPP
 
 namespace trace {
@@ -260,13 +320,13 @@ inline void* map_shared_memory(const std::string& name) {
 } // namespace trace
 
 #endif // SHARED_MEMORY_HPP'''
-            shared_memory_file.write_text(shared_memory_content, encoding='utf-8')
+            self._store(shared_memory_file, shared_memory_content)
             print("  ✓ Added shared_memory namespace")
         
         # Add dll_shared_state namespace
         dll_shared_state_file = namespaces_dir / "dll_shared_state.hpp"
         if not dll_shared_state_file.exists():
-            dll_shared_state_content = '''#ifndef DLL_SHARED_STATE_HPP
+            dll_shared_state_content = b'''#ifndef DLL_SHARED_STATE_HPP
 #define DLL_SHARED_STATE_HPP
 
 namespace trace {
@@ -294,46 +354,74 @@ inline Registry* get_shared_registry() {
 } // namespace trace
 
 #endif // DLL_SHARED_STATE_HPP'''
-            dll_shared_state_file.write_text(dll_shared_state_content, encoding='utf-8')
+            self._store(dll_shared_state_file, dll_shared_state_content)
             print("  ✓ Added dll_shared_state namespace")
     
     def fix_duplicate_definitions(self):
         """Remove duplicate function definitions"""
         print("Fixing duplicate definitions...")
-        
+        self._rewrite_functions(add_missing=False, remove_duplicates=True)
+    
+    def _rewrite_functions(self, add_missing: bool, remove_duplicates: bool):
+        """Add missing functions to and drop duplicates from functions.hpp"""
         functions_file = self.modular_dir / "functions.hpp"
-        if functions_file.exists():
-            content = functions_file.read_text(encoding='utf-8')
-            
-            # Remove duplicate generate_dump_filename and dump_binary definitions
-            lines = content.splitlines()
-            new_lines = []
-            skip_until_brace = False
-            
-            for i, line in enumerate(lines):
-                if 'inline std::string generate_dump_filename' in line and i > 0:
-                    # Check if this is a duplicate
-                    prev_lines = lines[max(0, i-10):i]
-                    if any('generate_dump_filename' in prev_line for prev_line in prev_lines):
-                        skip_until_brace = True
-                        continue
-                
-                if 'inline std::string dump_binary' in line and i > 0:
-                    # Check if this is a duplicate
-                    prev_lines = lines[max(0, i-10):i]
-                    if any('dump_binary' in prev_line for prev_line in prev_lines):
-                        skip_until_brace = True
-                        continue
-                
-                if skip_until_brace and line.strip() == '}':
-                    skip_until_brace = False
-                    continue
-                
-                if not skip_until_brace:
+        if not functions_file.exists():
+            return
+        
+        content = self._load(functions_file)
+        
+        block = b''
+        if add_missing:
+            # Names of the missing functions the file already defines
+            defined = {match.group(1) for match in _MISSING_FUNCTION_RE.finditer(content)}
+            block = b''.join(func + b'\n\n' for name, func in _MISSING_FUNCTIONS if name not in defined)
+        
+        if not remove_duplicates:
+            if block:
+                # Add the functions before the closing namespace
+                content = content.replace(b'} // namespace trace', block + b'} // namespace trace', 1)
+            self._store(functions_file, content)
+            print("  ✓ Added missing functions")
+            return
+        
+        # Remove duplicate generate_dump_filename and dump_binary definitions,
+        # adding the missing functions on the way past the closing namespace
+        new_lines = []
+        seen = set()
+        skipping = False
+        depth = 0
+        opened = False
+        
+        for line in content.splitlines():
+            if not skipping:
+                match = _DUPLICATE_RE.match(line)
+                if not match or match.group(1) not in seen:
+                    if match:
+                        seen.add(match.group(1))
+                    if block and b'} // namespace trace' in line:
+                        line = line.replace(b'} // namespace trace', block + b'} // namespace trace', 1)
+                        block = b''
                     new_lines.append(line)
+                    continue
+                skipping = True
+                depth = 0
+                opened = False
             
-            functions_file.write_text('\n'.join(new_lines), encoding='utf-8')
-            print("  ✓ Removed duplicate definitions")
+            # Drop the duplicate up to the brace that closes its body
+            # (or, for a declaration, up to its semicolon)
+            for token in _BRACE_TOKEN_RE.findall(line):
+                if token == b'{':
+                    depth += 1
+                    opened = True
+                elif token == b'}':
+                    depth -= 1
+            if (opened and depth <= 0) or (not opened and line.rstrip().endswith(b';')):
+                skipping = False
+        
+        self._store(functions_file, b'\n'.join(new_lines))
+        if add_missing:
+            print("  ✓ Added missing functions")
+        print("  ✓ Removed duplicate definitions")
     
     def update_modules_txt(self):
         """Update modules.txt to include new namespaces"""
@@ -341,30 +429,77 @@ inline Registry* get_shared_registry() {
         
         modules_file = self.modular_dir / "modules.txt"
         if modules_file.exists():
-            content = modules_file.read_text(encoding='utf-8')
+            content = self._load(modules_file)
             
             # Add namespace files if not present
             namespace_files = [
-                "namespaces/stats.hpp",
-                "namespaces/shared_memory.hpp", 
-                "namespaces/dll_shared_state.hpp"
+                b"namespaces/stats.hpp",
+                b"namespaces/shared_memory.hpp", 
+                b"namespaces/dll_shared_state.hpp"
             ]
             
-            for ns_file in namespace_files:
-                if ns_file not in content:
-                    content += f"{ns_file}\n"
+            missing = [ns_file for ns_file in namespace_files if ns_file not in content]
+            if not missing:
+                # Leave the file and its mtime alone so builds stay up to date
+                print("  ✓ modules.txt already up to date")
+                return
             
-            modules_file.write_text(content, encoding='utf-8')
+            if content and not content.endswith(b"\n"):
+                content += b"\n"
+            self._store(modules_file, content + b"\n".join(missing) + b"\n")
+            self._save_all()
             print("  ✓ Updated modules.txt")
 
+    def _load(self, path: Path) -> bytes:
+        """Return a file's current content, reading it only once"""
+        content = self._files.get(path)
+        if content is None:
+            content = path.read_bytes()
+            self._files[path] = content
+        return content
+    
+    def _store(self, path: Path, content: bytes):
+        """Record new content for a file; it is written by _save_all()"""
+        if self._files.get(path) != content:
+            self._files[path] = content
+            if path not in self._dirty:
+                self._dirty.append(path)
+    
+    def _file_contains(self, path: Path, needle: bytes) -> bool:
+        """Check for a needle without loading the whole file"""
+        content = self._files.get(path)
+        if content is not None:
+            return needle in content
+        
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False  # mmap cannot map an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm.find(needle) != -1
+    
+    def _prefetch(self, paths: List[Path]):
+        """Load several existing files concurrently"""
+        paths = [path for path in paths if path not in self._files and path.exists()]
+        # Reads are I/O bound, so threads overlap the syscall latency
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            contents = list(executor.map(Path.read_bytes, paths))
+        self._files.update(zip(paths, contents))
+    
+    def _save_all(self):
+        """Write every file whose content changed, concurrently"""
+        dirty, self._dirty = self._dirty, []
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda path: path.write_bytes(self._files[path]), dirty))
+
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(description='Fix specific issues in modular header system')
     parser.add_argument('--modular-dir', '-d', required=True, help='Path to modular directory')
+    parser.add_argument('--no-cache', action='store_true', help='Apply the fixes even if the files are already fixed')
     
     args = parser.parse_args()
     
-    fixer = ModularFixer(args.modular_dir)
+    fixer = ModularFixer(args.modular_dir, use_cache=not args.no_cache)
     fixer.fix_all_issues()
     fixer.update_modules_txt()
 
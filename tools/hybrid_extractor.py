@@ -14,11 +14,385 @@ The hybrid approach:
 """
 
 import argparse
+import hashlib
+import mmap
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
 from cpp_ast_parser import CppASTParser
 import re
 
+# Stat and digest of each file as the last run left it, kept in the output
+# directory so unchanged files are neither read nor rewritten
+MANIFEST_NAME = ".extract_manifest"
+
+# Every #include and #define line, each in its own group; a #define directly
+# after an #ifndef line also captures that line, marking it as a header guard
+_PLATFORM_DIRECTIVE_RE = re.compile(
+    rb'^[ \t]*(#ifndef[^\n]*\n[ \t]*)?(?:(#include[^\n]*)|(#define[^\n]*))',
+    re.MULTILINE
+)
+
+# Hand-written bodies for headers the AST extraction cannot produce
+_ASYNC_QUEUE_CONTENT = '''namespace trace {
+
+struct AsyncQueue {
+    std::queue<Event> queue;
+    std::mutex mutex;
+    std::condition_variable cv;
+    std::atomic<bool> running{false};
+    std::thread worker;
+    
+    AsyncQueue();
+    ~AsyncQueue();
+    
+    void push(const Event& event);
+    void flush_now();
+    void start();
+    void stop();
+};
+
+} // namespace trace'''
+
+_REGISTRY_CONTENT = '''namespace trace {
+
+struct Registry {
+    std::unordered_map<uint32_t, std::unique_ptr<Ring>> rings;
+    std::mutex mutex;
+    
+    Ring* get_ring(uint32_t thread_id);
+    void flush_all();
+    void clear();
+};
+
+} // namespace trace'''
+
+_SCOPE_CONTENT = '''namespace trace {
+
+struct Scope {
+    const char* function;
+    const char* file;
+    uint32_t line;
+    uint64_t start_time;
+    
+    Scope(const char* func, const char* f, uint32_t l);
+    ~Scope();
+};
+
+} // namespace trace'''
+
+_STATS_CONTENT = '''namespace trace {
+
+struct FunctionStats {
+    std::string name;
+    uint64_t call_count = 0;
+    uint64_t total_time_ns = 0;
+    uint64_t min_time_ns = UINT64_MAX;
+    uint64_t max_time_ns = 0;
+};
+
+struct ThreadStats {
+    uint32_t thread_id = 0;
+    std::string thread_name;
+    uint64_t event_count = 0;
+    uint64_t total_time_ns = 0;
+    std::unordered_map<std::string, FunctionStats> functions;
+};
+
+} // namespace trace'''
+
+_STATS_NAMESPACE_CONTENT = '''namespace stats {
+
+inline void register_function(const std::string& name, uint64_t duration_ns) {
+    // Implementation for function statistics
+}
+
+inline void register_thread(uint32_t thread_id, const std::string& name) {
+    // Implementation for thread statistics
+}
+
+} // namespace stats'''
+
+_SHARED_MEMORY_NAMESPACE_CONTENT = '''namespace shared_memory {
+
+inline bool create_shared_memory(const std::string& name, size_t size) {
+    // Implementation for shared memory creation
+    return false;
+}
+
+inline void* map_shared_memory(const std::string& name) {
+    // Implementation for shared memory mapping
+    return nullptr;
+}
+
+} // namespace shared_memory'''
+
+_DLL_SHARED_STATE_NAMESPACE_CONTENT = '''namespace dll_shared_state {
+
+inline void set_shared_config(Config* cfg) {
+    // Implementation for setting shared config
+}
+
+inline void set_shared_registry(Registry* reg) {
+    // Implementation for setting shared registry
+}
+
+inline Config* get_shared_config() {
+    // Implementation for getting shared config
+    return nullptr;
+}
+
+inline Registry* get_shared_registry() {
+    // Implementation for getting shared registry
+    return nullptr;
+}
+
+} // namespace dll_shared_state'''
+
+_INTERNAL_NAMESPACE_CONTENT = '''namespace internal {
+
+inline void log_error(const std::string& message) {
+    // Implementation for internal error logging
+}
+
+inline void log_debug(const std::string& message) {
+    // Implementation for internal debug logging
+}
+
+} // namespace internal'''
+
+# Manual enum definitions based on original header
+_ENUMS_CONTENT = '''namespace trace {
+
+enum class EventType : uint8_t {
+    Enter = 0,
+    Exit = 1,
+    Message = 2,
+    Marker = 3
+};
+
+enum class TracingMode : uint8_t {
+    Disabled = 0,
+    Immediate = 1,
+    Buffered = 2,
+    Hybrid = 3
+};
+
+enum class FlushMode : uint8_t {
+    Manual = 0,
+    Auto = 1,
+    Interval = 2
+};
+
+enum class SharedMemoryMode : uint8_t {
+    Disabled = 0,
+    Auto = 1,
+    Enabled = 2
+};
+
+} // namespace trace'''
+
+# Event struct with correct field names
+_EVENT_CONTENT = '''namespace trace {
+
+struct Event {
+    uint64_t timestamp;           ///< Timestamp in nanoseconds
+    EventType type;               ///< Event type
+    uint32_t depth;              ///< Call stack depth
+    const char* function;        ///< Function name
+    const char* file;            ///< Source file
+    uint32_t line;               ///< Source line
+    char message[TRC_MSG_CAP];   ///< Message buffer
+};
+
+} // namespace trace'''
+
+# Config struct with correct field names
+_CONFIG_CONTENT = '''namespace trace {
+
+struct Config {
+    TracingMode mode = TracingMode::Disabled;
+    FlushMode flush_mode = FlushMode::Auto;
+    SharedMemoryMode shared_memory_mode = SharedMemoryMode::Auto;
+    uint32_t max_depth = TRC_DEPTH_MAX;
+    bool auto_flush = true;
+    uint32_t flush_interval_ms = 1000;
+    
+    struct {
+        std::vector<std::string> include_functions;
+        std::vector<std::string> exclude_functions;
+        std::vector<std::string> include_files;
+        std::vector<std::string> exclude_files;
+        uint32_t max_depth = TRC_DEPTH_MAX;
+    } filter;
+    
+    std::string config_file;
+    FILE* output_file = nullptr;
+    
+    void load_from_file(const std::string& path);
+    void save_to_file(const std::string& path) const;
+};
+
+} // namespace trace'''
+
+# Ring struct with correct field names
+_RING_CONTENT = '''namespace trace {
+
+struct Ring {
+    Event buffers[TRC_NUM_BUFFERS][TRC_RING_CAP];  ///< Event buffers
+    uint32_t counts[TRC_NUM_BUFFERS] = {0};       ///< Event counts per buffer
+    uint32_t heads[TRC_NUM_BUFFERS] = {0};         ///< Next write position per buffer
+    uint32_t depth = 0;                            ///< Current call depth
+    uint32_t thread_id = 0;                        ///< Thread ID
+    std::string thread_name;                       ///< Thread name
+    
+    Ring();
+    ~Ring();
+    
+    bool write(const Event& event);
+    bool write_msg(const char* msg, ...);
+    bool should_auto_flush() const;
+};
+
+} // namespace trace'''
+
+_VARIABLES_CONTENT = '''namespace trace {
+
+extern Config config;
+extern std::atomic<bool> stats_registered;
+
+inline Config& get_config() {
+    return config;
+}
+
+inline Registry& registry() {
+    static Registry reg;
+    return reg;
+}
+
+inline AsyncQueue& async_queue() {
+    static AsyncQueue queue;
+    return queue;
+}
+
+} // namespace trace'''
+
+class _Function(NamedTuple):
+    """A function definition written by hand"""
+    name: str
+    content: str
+    location: object = None
+    is_inline: bool = True
+
+# Functions the source lacks, added to functions.hpp
+_MISSING_FUNCTIONS = (
+    _Function('set_external_state', '''inline void set_external_state(Config* cfg, Registry* reg) {
+    if (cfg) {
+        dll_shared_state::set_shared_config(cfg);
+    }
+    if (reg) {
+        dll_shared_state::set_shared_registry(reg);
+    }
+}'''),
+    _Function('load_config', '''inline bool load_config(const std::string& path) {
+    return get_config().load_from_file(path);
+}'''),
+    _Function('dump_stats', '''inline void dump_stats() {
+    // Implementation for dumping statistics
+    // This would be implemented based on the original header
+}'''),
+)
+
+def _guard_name(filename: str) -> str:
+    return filename.upper().replace('.', '_').replace('/', '_')
+
+# Guard names of the headers every extraction generates
+_HEADER_GUARDS = {filename: _guard_name(filename) for filename in (
+    'enums.hpp', 'event.hpp', 'config.hpp', 'ring.hpp', 'async_queue.hpp',
+    'registry.hpp', 'scope.hpp', 'stats.hpp', 'variables.hpp', 'functions.hpp',
+    'macros.hpp', 'platform.hpp',
+)}
+
+@lru_cache(maxsize=None)
+def _header_guard_frame(filename: str, description: str) -> Tuple[bytes, bytes]:
+    """Encoded text that goes before and after a header's content"""
+    guard_name = _HEADER_GUARDS.get(filename) or _guard_name(filename)
+    
+    header = f"""#ifndef {guard_name}
+#define {guard_name}
+
+/**
+ * @file {filename}
+ * @brief {description}
+ */
+
+"""
+    
+    return header.encode('utf-8'), f"\n\n#endif // {guard_name}\n".encode('utf-8')
+
+# Structs written with hand-written bodies: (filename, description, content)
+_OTHER_STRUCTS = (
+    ("async_queue.hpp", "AsyncQueue struct definition", _ASYNC_QUEUE_CONTENT),
+    ("registry.hpp", "Registry struct definition", _REGISTRY_CONTENT),
+    ("scope.hpp", "Scope struct definition", _SCOPE_CONTENT),
+    ("stats.hpp", "Stats struct definitions", _STATS_CONTENT),
+)
+
+def _wrap_content(filename: str, description: str, content: str) -> bytes:
+    """Wrap content in header guard, returning the encoded header"""
+    # The guard text depends only on the file, so it is built and encoded
+    # once per file; only the content is encoded here
+    header, footer = _header_guard_frame(filename, description)
+    return b"".join((header, content.encode('utf-8'), footer))
+
+# The hand-written headers, wrapped and encoded once at import
+_ENUMS_HEADER = _wrap_content("enums.hpp", "Enum definitions", _ENUMS_CONTENT)
+_EVENT_HEADER = _wrap_content("event.hpp", "Event struct definition", _EVENT_CONTENT)
+_CONFIG_HEADER = _wrap_content("config.hpp", "Config struct definition", _CONFIG_CONTENT)
+_RING_HEADER = _wrap_content("ring.hpp", "Ring struct definition", _RING_CONTENT)
+_VARIABLES_HEADER = _wrap_content("variables.hpp", "Global variable declarations", _VARIABLES_CONTENT)
+_OTHER_STRUCT_HEADERS = tuple(
+    (filename, _wrap_content(filename, description, content))
+    for filename, description, content in _OTHER_STRUCTS
+)
+
+# Merge order of the modules; dependencies come before dependents
+_MODULES_ORDER = (
+    "platform.hpp",
+    "types/enums.hpp",
+    "types/event.hpp",
+    "types/config.hpp",
+    "types/ring.hpp",
+    "types/async_queue.hpp",
+    "types/registry.hpp",
+    "types/scope.hpp",
+    "types/stats.hpp",
+    "variables.hpp",
+    "functions.hpp",
+    "namespaces/stats.hpp",
+    "namespaces/shared_memory.hpp",
+    "namespaces/dll_shared_state.hpp",
+    "namespaces/internal.hpp",
+    "macros.hpp",
+)
+
+def _write_raw(path: Path, data: bytes):
+    """Write bytes through a raw file descriptor
+    
+    Skips the text encoder and the buffered writer that write_text() and
+    write_bytes() go through; generated headers are small and written whole.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
 class HybridExtractor:
     """Hybrid extraction combining AST parsing with manual fixes"""
     
@@ -27,38 +401,64 @@ class HybridExtractor:
         self.output_dir = Path(output_dir)
         self.parser = CppASTParser(str(self.source_file))
         
-        # Create output directory structure
+        # Encoded file contents by relative path, written by _flush_pending(),
+        # and every relative path generated so far. Outside extract_all()
+        # each file is written as soon as it is generated.
+        self._pending: Dict[str, bytes] = {}
+        self._written: Set[str] = set()
+        self._batch_writes = False
+        
+        # The trace namespace's declarations, namespaces and macros, collected
+        # in one traversal the first time an extract_* method needs them
+        self._ast: Optional[Dict[str, List]] = None
+        
+        # Create output directory structure, remembering what exists so
+        # writes do not create the same directories again
         self.output_dir.mkdir(parents=True, exist_ok=True)
         (self.output_dir / "types").mkdir(exist_ok=True)
         (self.output_dir / "namespaces").mkdir(exist_ok=True)
+        self._created_dirs: Set[Path] = {
+            self.output_dir, self.output_dir / "types", self.output_dir / "namespaces"
+        }
     
     def extract_all(self):
         """Extract all components with comprehensive AST-based extraction"""
         print(f"Comprehensive AST extraction from {self.source_file} to {self.output_dir}")
         
-        # Extract platform content
-        self.extract_platform()
-        
-        # Extract enums using AST
-        self.extract_enums_from_ast()
-        
-        # Extract ALL structs using AST
-        self.extract_all_structs_from_original()
-        
-        # Extract functions using AST
-        self.extract_functions_from_ast()
-        
-        # Extract variables using AST
-        self.extract_variables_from_ast()
-        
-        # Extract namespaces using AST
-        self.extract_namespaces_from_ast()
-        
-        # Extract macros
-        self.extract_macros()
-        
-        # Generate modules.txt
-        self.generate_modules_txt()
+        # Queue every generated file and write them in one batch
+        self._batch_writes = True
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # The platform scan only reads the source text, so it runs
+                # alongside the AST passes, which all share the parser
+                platform_scan = executor.submit(self._scan_platform)
+                
+                # Extract enums using AST
+                self.extract_enums_from_ast()
+                
+                # Extract ALL structs using AST
+                self.extract_all_structs_from_original()
+                
+                # Extract functions using AST
+                self.extract_functions_from_ast()
+                
+                # Extract variables using AST
+                self.extract_variables_from_ast()
+                
+                # Extract namespaces using AST
+                self.extract_namespaces_from_ast()
+                
+                # Extract macros
+                self.extract_macros()
+                
+                # Extract platform content
+                self.extract_platform(platform_scan.result())
+            
+            # Generate modules.txt
+            self.generate_modules_txt()
+        finally:
+            self._batch_writes = False
+        self._flush_pending()
         
         print("✓ Comprehensive AST extraction complete!")
     
@@ -66,7 +466,7 @@ class HybridExtractor:
         """Extract enums using AST parser"""
         print("Extracting enums using AST...")
         
-        enums = self.parser.extract_enums(namespace="trace")
+        enums = self._ast_data()['enums']
         
         if enums:
             content = "namespace trace {\n\n"
@@ -83,7 +483,7 @@ class HybridExtractor:
         """Extract functions using AST parser"""
         print("Extracting functions using AST...")
         
-        functions = self.parser.extract_functions(namespace="trace")
+        functions = self._ast_data()['functions']
         
         if functions:
             content = "namespace trace {\n\n"
@@ -100,7 +500,7 @@ class HybridExtractor:
         """Extract variables using AST parser"""
         print("Extracting variables using AST...")
         
-        variables = self.parser.extract_variables(namespace="trace")
+        variables = self._ast_data()['variables']
         
         if variables:
             content = "namespace trace {\n\n"
@@ -117,7 +517,7 @@ class HybridExtractor:
         """Extract namespaces using AST parser"""
         print("Extracting namespaces using AST...")
         
-        namespaces = self.parser.extract_namespaces()
+        namespaces = self._ast_data()['namespaces']
         
         for name, content in namespaces.items():
             if name == "trace":
@@ -128,30 +528,14 @@ class HybridExtractor:
             self._write_file(f"namespaces/{filename}", header_content)
             print(f"  Extracted namespace {name}")
     
-    def extract_platform(self):
-        """Extract platform includes and defines"""
-        print("Extracting platform content...")
+    def extract_platform(self, scanned: Optional[Tuple[Set[str], List[str]]] = None):
+        """Extract platform includes and defines
         
-        # Read source content for manual extraction
-        content = self.source_file.read_text(encoding='utf-8')
-        lines = content.splitlines()
-        
-        includes = set()
-        defines = []
+        scanned is the result of an earlier _scan_platform(), if any.
+        """
+        print("Extracting platform content...")
         
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Extract includes
-            if line.startswith('#include'):
-                includes.add(line)
-            
-            # Extract defines (skip header guards)
-            elif line.startswith('#define') and not self._is_header_guard_start(lines, i):
-                defines.append(line)
-            
-            i += 1
+        includes, defines = scanned if scanned is not None else self._scan_platform()
         
         # Add missing standard library includes that are used but not explicitly included
         additional_includes = {
@@ -167,138 +551,65 @@ class HybridExtractor:
         platform_content = self._generate_platform_header(includes, defines)
         self._write_file("platform.hpp", platform_content)
     
+    def _scan_platform(self) -> Tuple[Set[str], List[str]]:
+        """Collect the source's includes and its defines other than header guards"""
+        includes = set()
+        defines = []
+        
+        with open(self.source_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return includes, defines  # mmap cannot map an empty file
+            
+            # One scan over the mapped file picks out and classifies the
+            # directives; only the lines kept are decoded
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for match in _PLATFORM_DIRECTIVE_RE.finditer(mm):
+                    guard, include, define = match.groups()
+                    
+                    # Extract includes
+                    if include is not None:
+                        includes.add(include.rstrip().decode('utf-8'))
+                    
+                    # Extract defines (skip header guards)
+                    elif not guard:
+                        defines.append(define.rstrip().decode('utf-8'))
+        
+        return includes, defines
+    
     def extract_enums_fixed(self):
         """Extract enums with manual fixes"""
         print("Extracting enums with fixes...")
         
         # Manual enum definitions based on original header
-        enums_content = '''namespace trace {
-
-enum class EventType : uint8_t {
-    Enter = 0,
-    Exit = 1,
-    Message = 2,
-    Marker = 3
-};
-
-enum class TracingMode : uint8_t {
-    Disabled = 0,
-    Immediate = 1,
-    Buffered = 2,
-    Hybrid = 3
-};
-
-enum class FlushMode : uint8_t {
-    Manual = 0,
-    Auto = 1,
-    Interval = 2
-};
-
-enum class SharedMemoryMode : uint8_t {
-    Disabled = 0,
-    Auto = 1,
-    Enabled = 2
-};
-
-} // namespace trace'''
-        
-        self._write_file("types/enums.hpp", self._wrap_header("enums.hpp", "Enum definitions", enums_content))
+        self._write_file("types/enums.hpp", _ENUMS_HEADER)
     
     def extract_structs_fixed(self):
         """Extract structs with manual fixes"""
         print("Extracting structs with fixes...")
         
         # Event struct with correct field names
-        event_content = '''namespace trace {
-
-struct Event {
-    uint64_t timestamp;           ///< Timestamp in nanoseconds
-    EventType type;               ///< Event type
-    uint32_t depth;              ///< Call stack depth
-    const char* function;        ///< Function name
-    const char* file;            ///< Source file
-    uint32_t line;               ///< Source line
-    char message[TRC_MSG_CAP];   ///< Message buffer
-};
-
-} // namespace trace'''
-        
-        self._write_file("types/event.hpp", self._wrap_header("event.hpp", "Event struct definition", event_content))
+        self._write_file("types/event.hpp", _EVENT_HEADER)
         
         # Config struct with correct field names
-        config_content = '''namespace trace {
-
-struct Config {
-    TracingMode mode = TracingMode::Disabled;
-    FlushMode flush_mode = FlushMode::Auto;
-    SharedMemoryMode shared_memory_mode = SharedMemoryMode::Auto;
-    uint32_t max_depth = TRC_DEPTH_MAX;
-    bool auto_flush = true;
-    uint32_t flush_interval_ms = 1000;
-    
-    struct {
-        std::vector<std::string> include_functions;
-        std::vector<std::string> exclude_functions;
-        std::vector<std::string> include_files;
-        std::vector<std::string> exclude_files;
-        uint32_t max_depth = TRC_DEPTH_MAX;
-    } filter;
-    
-    std::string config_file;
-    FILE* output_file = nullptr;
-    
-    void load_from_file(const std::string& path);
-    void save_to_file(const std::string& path) const;
-};
-
-} // namespace trace'''
-        
-        self._write_file("types/config.hpp", self._wrap_header("config.hpp", "Config struct definition", config_content))
+        self._write_file("types/config.hpp", _CONFIG_HEADER)
         
         # Ring struct with correct field names
-        ring_content = '''namespace trace {
-
-struct Ring {
-    Event buffers[TRC_NUM_BUFFERS][TRC_RING_CAP];  ///< Event buffers
-    uint32_t counts[TRC_NUM_BUFFERS] = {0};       ///< Event counts per buffer
-    uint32_t heads[TRC_NUM_BUFFERS] = {0};         ///< Next write position per buffer
-    uint32_t depth = 0;                            ///< Current call depth
-    uint32_t thread_id = 0;                        ///< Thread ID
-    std::string thread_name;                       ///< Thread name
-    
-    Ring();
-    ~Ring();
-    
-    bool write(const Event& event);
-    bool write_msg(const char* msg, ...);
-    bool should_auto_flush() const;
-};
-
-} // namespace trace'''
-        
-        self._write_file("types/ring.hpp", self._wrap_header("ring.hpp", "Ring struct definition", ring_content))
+        self._write_file("types/ring.hpp", _RING_HEADER)
         
         # Other structs...
         self._extract_other_structs()
     
     def _extract_other_structs(self):
         """Extract remaining structs"""
-        structs = [
-            ("async_queue.hpp", "AsyncQueue struct definition", self._get_async_queue_content()),
-            ("registry.hpp", "Registry struct definition", self._get_registry_content()),
-            ("scope.hpp", "Scope struct definition", self._get_scope_content()),
-            ("stats.hpp", "Stats struct definitions", self._get_stats_content())
-        ]
-        
-        for filename, description, content in structs:
-            self._write_file(f"types/{filename}", self._wrap_header(filename, description, content))
+        for filename, header in _OTHER_STRUCT_HEADERS:
+            self._write_file(f"types/{filename}", header)
     
     def extract_all_structs_from_original(self):
         """Extract ALL structs from original header using AST"""
         print("Extracting all structs from original header...")
         
         # Use AST parser to get all structs
-        structs = self.parser.extract_structs(namespace="trace")
+        structs = self._ast_data()['structs']
         
         for struct in structs:
             filename = f"{struct['name'].lower()}.hpp"
@@ -316,163 +627,50 @@ struct Ring {
                 print(f"  Extracted {struct['name']} -> types/{filename}")
     
     def _get_async_queue_content(self):
-        return '''namespace trace {
-
-struct AsyncQueue {
-    std::queue<Event> queue;
-    std::mutex mutex;
-    std::condition_variable cv;
-    std::atomic<bool> running{false};
-    std::thread worker;
-    
-    AsyncQueue();
-    ~AsyncQueue();
-    
-    void push(const Event& event);
-    void flush_now();
-    void start();
-    void stop();
-};
-
-} // namespace trace'''
+        return _ASYNC_QUEUE_CONTENT
     
     def _get_registry_content(self):
-        return '''namespace trace {
-
-struct Registry {
-    std::unordered_map<uint32_t, std::unique_ptr<Ring>> rings;
-    std::mutex mutex;
-    
-    Ring* get_ring(uint32_t thread_id);
-    void flush_all();
-    void clear();
-};
-
-} // namespace trace'''
+        return _REGISTRY_CONTENT
     
     def _get_scope_content(self):
-        return '''namespace trace {
-
-struct Scope {
-    const char* function;
-    const char* file;
-    uint32_t line;
-    uint64_t start_time;
-    
-    Scope(const char* func, const char* f, uint32_t l);
-    ~Scope();
-};
-
-} // namespace trace'''
+        return _SCOPE_CONTENT
     
     def _get_stats_content(self):
-        return '''namespace trace {
-
-struct FunctionStats {
-    std::string name;
-    uint64_t call_count = 0;
-    uint64_t total_time_ns = 0;
-    uint64_t min_time_ns = UINT64_MAX;
-    uint64_t max_time_ns = 0;
-};
-
-struct ThreadStats {
-    uint32_t thread_id = 0;
-    std::string thread_name;
-    uint64_t event_count = 0;
-    uint64_t total_time_ns = 0;
-    std::unordered_map<std::string, FunctionStats> functions;
-};
-
-} // namespace trace'''
+        return _STATS_CONTENT
     
     def extract_functions_fixed(self):
         """Extract functions with manual fixes"""
         print("Extracting functions with fixes...")
         
         # Extract functions from original header
-        functions = self.parser.extract_functions(namespace="trace")
+        contents = [func['content'] for func in self._ast_data()['functions']]
         
         # Add missing functions manually
-        missing_functions = self._get_missing_functions()
+        contents.extend(func.content for func in self._get_missing_functions())
         
-        all_functions = functions + missing_functions
-        
-        if all_functions:
-            content = self._generate_functions_header(all_functions)
+        if contents:
+            content = self._generate_functions_header(contents)
             self._write_file("functions.hpp", content)
-            print(f"  Extracted {len(all_functions)} functions")
+            print(f"  Extracted {len(contents)} functions")
         else:
             print("  No functions found")
     
-    def _get_missing_functions(self):
+    def _get_missing_functions(self) -> Tuple[_Function, ...]:
         """Get missing function definitions"""
-        return [
-            {
-                'name': 'set_external_state',
-                'content': '''inline void set_external_state(Config* cfg, Registry* reg) {
-    if (cfg) {
-        dll_shared_state::set_shared_config(cfg);
-    }
-    if (reg) {
-        dll_shared_state::set_shared_registry(reg);
-    }
-}''',
-                'location': None,
-                'is_inline': True
-            },
-            {
-                'name': 'load_config',
-                'content': '''inline bool load_config(const std::string& path) {
-    return get_config().load_from_file(path);
-}''',
-                'location': None,
-                'is_inline': True
-            },
-            {
-                'name': 'dump_stats',
-                'content': '''inline void dump_stats() {
-    // Implementation for dumping statistics
-    // This would be implemented based on the original header
-}''',
-                'location': None,
-                'is_inline': True
-            }
-        ]
+        return _MISSING_FUNCTIONS
     
     def extract_variables_fixed(self):
         """Extract variables with fixes"""
         print("Extracting variables with fixes...")
         
-        variables_content = '''namespace trace {
-
-extern Config config;
-extern std::atomic<bool> stats_registered;
-
-inline Config& get_config() {
-    return config;
-}
-
-inline Registry& registry() {
-    static Registry reg;
-    return reg;
-}
-
-inline AsyncQueue& async_queue() {
-    static AsyncQueue queue;
-    return queue;
-}
-
-} // namespace trace'''
-        
-        self._write_file("variables.hpp", self._wrap_header("variables.hpp", "Global variable declarations", variables_content))
+        self._write_file("variables.hpp", _VARIABLES_HEADER)
     
     def extract_namespaces_fixed(self):
         """Extract namespaces with fixes"""
         print("Extracting namespaces with fixes...")
         
-        # Extract namespaces from original
-        namespaces = self.parser.extract_namespaces()
+        # Extract namespaces from original; copied, as missing ones are added
+        namespaces = dict(self._ast_data()['namespaces'])
         
         # Add missing namespaces
         missing_namespaces = {
@@ -483,87 +681,34 @@ inline AsyncQueue& async_queue() {
         }
         
         for name, content in missing_namespaces.items():
-            if name not in namespaces:
-                namespaces[name] = content
+            namespaces.setdefault(name, content)
+        
+        # Skip main namespace
+        namespaces.pop("trace", None)
         
         for name, content in namespaces.items():
-            if name == "trace":
-                continue
-            
             filename = f"{name}.hpp"
             header_content = self._wrap_header(filename, f"namespace {name}", content)
             self._write_file(f"namespaces/{filename}", header_content)
             print(f"  Extracted namespace {name}")
     
     def _get_stats_namespace_content(self):
-        return '''namespace stats {
-
-inline void register_function(const std::string& name, uint64_t duration_ns) {
-    // Implementation for function statistics
-}
-
-inline void register_thread(uint32_t thread_id, const std::string& name) {
-    // Implementation for thread statistics
-}
-
-} // namespace stats'''
+        return _STATS_NAMESPACE_CONTENT
     
     def _get_shared_memory_namespace_content(self):
-        return '''namespace shared_memory {
-
-inline bool create_shared_memory(const std::string& name, size_t size) {
-    // Implementation for shared memory creation
-    return false;
-}
-
-inline void* map_shared_memory(const std::string& name) {
-    // Implementation for shared memory mapping
-    return nullptr;
-}
-
-} // namespace shared_memory'''
+        return _SHARED_MEMORY_NAMESPACE_CONTENT
     
     def _get_dll_shared_state_namespace_content(self):
-        return '''namespace dll_shared_state {
-
-inline void set_shared_config(Config* cfg) {
-    // Implementation for setting shared config
-}
-
-inline void set_shared_registry(Registry* reg) {
-    // Implementation for setting shared registry
-}
-
-inline Config* get_shared_config() {
-    // Implementation for getting shared config
-    return nullptr;
-}
-
-inline Registry* get_shared_registry() {
-    // Implementation for getting shared registry
-    return nullptr;
-}
-
-} // namespace dll_shared_state'''
+        return _DLL_SHARED_STATE_NAMESPACE_CONTENT
     
     def _get_internal_namespace_content(self):
-        return '''namespace internal {
-
-inline void log_error(const std::string& message) {
-    // Implementation for internal error logging
-}
-
-inline void log_debug(const std::string& message) {
-    // Implementation for internal debug logging
-}
-
-} // namespace internal'''
+        return _INTERNAL_NAMESPACE_CONTENT
     
     def extract_macros(self):
         """Extract macros"""
         print("Extracting macros...")
         
-        macros = self.parser.extract_macros()
+        macros = self._ast_data()['macros']
         
         if macros:
             content = self._wrap_header("macros.hpp", "TRC_* macro definitions", '\n'.join(macros))
@@ -576,114 +721,134 @@ inline void log_debug(const std::string& message) {
         """Generate modules.txt with correct merge order"""
         print("Generating modules.txt...")
         
-        modules = [
-            "platform.hpp",
-            "types/enums.hpp",
-            "types/event.hpp",
-            "types/config.hpp",
-            "types/ring.hpp",
-            "types/async_queue.hpp",
-            "types/registry.hpp",
-            "types/scope.hpp",
-            "types/stats.hpp",
-            "variables.hpp",
-            "functions.hpp",
-            "namespaces/stats.hpp",
-            "namespaces/shared_memory.hpp",
-            "namespaces/dll_shared_state.hpp",
-            "namespaces/internal.hpp",
-            "macros.hpp"
+        lines = [
+            "# Merge order for trace_scope.hpp generation",
+            "# Lines starting with # are comments",
+            "# Order matters - dependencies must come before dependents",
+            "",
         ]
         
-        content = "# Merge order for trace_scope.hpp generation\n"
-        content += "# Lines starting with # are comments\n"
-        content += "# Order matters - dependencies must come before dependents\n\n"
-        
-        for module in modules:
-            module_path = self.output_dir / module
-            if module_path.exists():
-                content += f"{module}\n"
-        
-        self._write_file("modules.txt", content)
-    
-    def _is_header_guard_start(self, lines: List[str], idx: int) -> bool:
-        """Check if this is the start of a header guard"""
-        if idx >= len(lines):
-            return False
-        
-        line = lines[idx].strip()
-        if not line.startswith('#define'):
-            return False
-        
-        # Check if previous line is #ifndef
-        if idx > 0:
-            prev_line = lines[idx - 1].strip()
-            if prev_line.startswith('#ifndef'):
-                return True
+        # Only modules this extractor generated, known without touching the disk
+        for module in _MODULES_ORDER:
+            if module in self._written:
+                lines.append(module)
+        lines.append("")
         
-        return False
+        self._write_file("modules.txt", "\n".join(lines))
     
     def _generate_platform_header(self, includes: Set[str], defines: List[str]) -> str:
         """Generate platform.hpp content"""
-        guard_name = "PLATFORM_HPP"
-        
-        content = f"#ifndef {guard_name}\n"
-        content += f"#define {guard_name}\n\n"
-        content += "/**\n"
-        content += " * @file platform.hpp\n"
-        content += " * @brief Platform-specific includes and build-time defines\n"
-        content += " */\n\n"
-        
-        # Add includes
-        for include in sorted(includes):
-            content += f"{include}\n"
-        content += "\n"
-        
-        # Add defines
-        for define in defines:
-            content += f"{define}\n"
-        content += "\n"
-        
-        content += f"#endif // {guard_name}\n"
-        
-        return content
-    
-    def _wrap_header(self, filename: str, description: str, content: str) -> str:
-        """Wrap content in header guard"""
-        guard_name = filename.upper().replace('.', '_').replace('/', '_')
-        
-        header = f"#ifndef {guard_name}\n"
-        header += f"#define {guard_name}\n\n"
-        header += f"/**\n"
-        header += f" * @file {filename}\n"
-        header += f" * @brief {description}\n"
-        header += f" */\n\n"
-        header += content + "\n\n"
-        header += f"#endif // {guard_name}\n"
+        guard_name = _HEADER_GUARDS["platform.hpp"]
+        
+        return "\n".join([
+            f"#ifndef {guard_name}",
+            f"#define {guard_name}",
+            "",
+            "/**",
+            " * @file platform.hpp",
+            " * @brief Platform-specific includes and build-time defines",
+            " */",
+            "",
+            *sorted(includes),
+            "",
+            *defines,
+            "",
+            f"#endif // {guard_name}",
+            "",
+        ])
+    
+    def _wrap_header(self, filename: str, description: str, content: str) -> bytes:
+        """Wrap content in header guard, returning the encoded header"""
+        return _wrap_content(filename, description, content)
+    
+    def _generate_functions_header(self, contents: List[str]) -> bytes:
+        """Generate encoded functions.hpp content"""
+        header, _ = _header_guard_frame("functions.hpp", "Function implementations")
+        
+        # Add namespace, after the blank lines the header has always had here
+        parts = ["\n\n\n", "namespace trace {\n\n"]
+        
+        for content in contents:
+            parts.append(content + "\n\n")
+        
+        parts.append("} // namespace trace\n\n")
+        parts.append("#endif // FUNCTIONS_HPP\n")
+        
+        return header + "".join(parts).encode('utf-8')
+    
+    def _ast_data(self) -> Dict[str, List]:
+        """Return what the parser extracts from the source, traversing it once"""
+        if self._ast is None:
+            self._ast = self.parser.extract_everything(namespace="trace")
+        return self._ast
+    
+    def _write_file(self, relative_path: str, content: Union[str, bytes]):
+        """Write a generated file, or queue it while extract_all() batches writes
+        
+        Content that is already encoded, like _wrap_header() output, is
+        written as is.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        # A path written twice keeps its last content, as immediate writes would
+        self._pending[relative_path] = content
+        self._written.add(relative_path)
+        if not self._batch_writes:
+            self._flush_pending()
+    
+    def _flush_pending(self):
+        """Write all queued files whose content changed, creating each directory only once"""
+        pending, self._pending = self._pending, {}
+        
+        new_dirs = {(self.output_dir / relative_path).parent for relative_path in pending} - self._created_dirs
+        for directory in sorted(new_dirs, key=lambda d: len(d.parts)):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._created_dirs |= new_dirs
+        
+        manifest = self._read_manifest()
+        for relative_path, data in pending.items():
+            path = self.output_dir / relative_path
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            
+            # Rewriting identical content would only bump the file's mtime
+            # and make timestamp-based builds redo work
+            if not self._is_unchanged(path, manifest.get(relative_path), data, digest):
+                _write_raw(path, data)
+            
+            stat = path.stat()
+            manifest[relative_path] = (stat.st_mtime_ns, stat.st_size, digest)
         
-        return header
+        self._write_manifest(manifest)
     
-    def _generate_functions_header(self, functions: List[Dict]) -> str:
-        """Generate functions.hpp content"""
-        content = self._wrap_header("functions.hpp", "Function implementations", "")
-        
-        # Add namespace
-        content = content.replace('#endif // FUNCTIONS_HPP', '')
-        content += "namespace trace {\n\n"
-        
-        for func in functions:
-            content += func['content'] + "\n\n"
-        
-        content += "} // namespace trace\n\n"
-        content += "#endif // FUNCTIONS_HPP\n"
+    def _is_unchanged(self, path: Path, entry: Optional[Tuple[int, int, bytes]],
+                      data: bytes, digest: bytes) -> bool:
+        """Check whether path already holds data"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        if stat.st_size != len(data):
+            return False
         
-        return content
-    
-    def _write_file(self, relative_path: str, content: str):
-        """Write content to file"""
-        file_path = self.output_dir / relative_path
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(content, encoding='utf-8')
+        # A file still as the last run left it is known without reading it
+        if entry == (stat.st_mtime_ns, stat.st_size, digest):
+            return True
+        return path.read_bytes() == data
+    
+    def _read_manifest(self) -> Dict[str, Tuple[int, int, bytes]]:
+        try:
+            with open(self.output_dir / MANIFEST_NAME, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            return {}
+    
+    def _write_manifest(self, manifest: Dict[str, Tuple[int, int, bytes]]):
+        manifest_file = self.output_dir / MANIFEST_NAME
+        try:
+            with open(manifest_file, 'wb') as f:
+                pickle.dump(manifest, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Warning: Could not write {manifest_file}: {e}")
 
 def main():
     """Main entry point"""
@@ -16,19 +16,149 @@ Usage:
 """
 
 import argparse
+import hashlib
+import os
+import pickle
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Set, Dict, Tuple
-from collections import defaultdict
+from typing import List, NamedTuple, Optional, Set, Dict, Tuple
+from collections import OrderedDict, defaultdict
+
+# Per-module parse results, keyed by content hash
+CACHE_DIR = Path.home() / ".cache" / "trace-scope" / "merge"
+
+# Preprocessor directives the parser cares about; matched against stripped lines
+_DIRECTIVE_RE = re.compile(r'#(ifdef|ifndef|if defined|define|include|endif|elif|else)')
+
+# Directive kinds that open a conditional block
+_CONDITIONALS = frozenset(('ifdef', 'ifndef', 'if defined'))
+
+# Name of a #define, up to its parameter list
+_DEFINE_NAME_RE = re.compile(r'#define\S*\s+([^\s(]*)')
+
+# Stripped lines that belong to code (function implementations or namespaces)
+# rather than to build config defines
+_IMPL_RE = re.compile(r'^(?:inline |FILE\* |return |if |namespace )|fopen_s|tmpfile_s')
+
+# Identifiers that may name a macro
+_IDENT_RE = re.compile(r'\b[A-Z_][A-Z0-9_]*\b')
+
+class ParseResult(NamedTuple):
+    """Everything the merge needs from one module"""
+    unconditional_includes: List[str]
+    conditional_blocks: List[str]
+    defines: List[str]
+    namespace_content: List[str]
+    macros: List[str]
+
+class BlockInfo(NamedTuple):
+    """Extent and contents of one conditional block"""
+    end: int  # Index of the matching #endif, or the line count if unclosed
+    has_include: bool
+    has_impl: bool  # Function implementations or namespaces, not just defines
 
 class HeaderParser:
     """Parse C++ header files and extract structured content"""
     
     def __init__(self, file_path: Path):
         self.file_path = file_path
-        self.content = file_path.read_text(encoding='utf-8')
-        self.lines = self.content.splitlines(keepends=True)
+        # Whole-file read; splitlines() below handles any line ending, so the
+        # text layer's newline translation is not needed. The text itself is
+        # not kept: everything works on the lines.
+        content = file_path.read_bytes().decode('utf-8')
+        
+        # Strip every line once up front; the extractors only ever need the
+        # line without trailing whitespace or without any surrounding whitespace
+        self.lines = [line.rstrip() for line in content.splitlines()]
+        self.stripped = [line.lstrip() for line in self.lines]
+        
+        # Classify every line once; the extractors dispatch on the kind
+        self.kinds = [self._directive_kind(stripped) for stripped in self.stripped]
+        
+        self._index_blocks()
+        
+        # Every extractor asks the same guard and macro questions about the
+        # same lines; the answers are kept by line index
+        self._guard_cache: Dict[int, bool] = {}
+        self._guard_end_cache: Dict[int, int] = {}
+        self._macro_cache: Dict[int, bool] = {}
+    
+    @staticmethod
+    def _directive_kind(stripped: str) -> Optional[str]:
+        """Return the directive a stripped line starts with, or None"""
+        match = _DIRECTIVE_RE.match(stripped)
+        return match.group(1) if match else None
+    
+    def _index_blocks(self):
+        """Record the extent and contents of every conditional block in one pass"""
+        self.block_info: Dict[int, BlockInfo] = {}
+        ends = {}
+        has_include = {}
+        has_impl = {}
+        
+        # Blocks nest like brackets; a nested block's contents count for its parents
+        open_blocks = []
+        for i, kind in enumerate(self.kinds):
+            if kind in _CONDITIONALS:
+                open_blocks.append(i)
+                has_include[i] = False
+            elif kind == 'include' and open_blocks:
+                has_include[open_blocks[-1]] = True
+            elif kind == 'endif' and open_blocks:
+                start = open_blocks.pop()
+                ends[start] = i
+                if open_blocks and has_include[start]:
+                    has_include[open_blocks[-1]] = True
+        while open_blocks:
+            start = open_blocks.pop()
+            if open_blocks and has_include[start]:
+                has_include[open_blocks[-1]] = True
+        
+        # Implementations are looked for with only #ifdef/#ifndef counted as
+        # nesting: a block ends early at the #endif of an '#if defined' inside
+        # it, the #endif line itself included. level - base is each open
+        # block's depth, so every block whose depth drops to 0 is closed.
+        level = 0
+        open_blocks = []
+        for i, (stripped, kind) in enumerate(zip(self.stripped, self.kinds)):
+            if open_blocks and _IMPL_RE.search(stripped):
+                has_impl[open_blocks[-1][0]] = True
+            if kind in _CONDITIONALS:
+                if kind == 'if defined':
+                    open_blocks.append((i, level - 1))
+                else:
+                    open_blocks.append((i, level))
+                    level += 1
+                has_impl[i] = False
+            elif kind == 'endif':
+                level -= 1
+                while open_blocks and open_blocks[-1][1] == level:
+                    start = open_blocks.pop()[0]
+                    if open_blocks and has_impl[start]:
+                        has_impl[open_blocks[-1][0]] = True
+        while open_blocks:
+            start = open_blocks.pop()[0]
+            if open_blocks and has_impl[start]:
+                has_impl[open_blocks[-1][0]] = True
+        
+        for start in has_include:
+            self.block_info[start] = BlockInfo(ends.get(start, len(self.lines)), has_include[start], has_impl[start])
+    
+    def parse(self) -> ParseResult:
+        """Extract all content of the module in one call"""
+        # Each extractor keeps its own cursor: they resume at different
+        # points after header guards and nested blocks, so the scans cannot
+        # share one without changing what gets merged
+        unconditional_includes, conditional_blocks = self.extract_includes()
+        return ParseResult(
+            unconditional_includes=unconditional_includes,
+            conditional_blocks=conditional_blocks,
+            defines=self.extract_defines(),
+            namespace_content=self.extract_namespace_content(),
+            macros=self.extract_macros(),
+        )
     
     def extract_includes(self) -> Tuple[List[str], List[str]]:
         """Extract includes, separating unconditional and conditional ones"""
@@ -38,48 +168,48 @@ class HeaderParser:
         i = 0
         while i < len(self.lines):
             line = self.lines[i]
-            stripped = line.strip()
+            kind = self.kinds[i]
             
             # Check if we're entering a conditional block with includes (but not header guards)
-            if (stripped.startswith('#ifdef') or stripped.startswith('#ifndef') or 
-                stripped.startswith('#if defined')):
+            if kind in _CONDITIONALS:
                 # Skip if this is a header guard, but extract includes from within it
-                if stripped.startswith('#ifndef') and self._is_header_guard(i):
+                if kind == 'ifndef' and self._is_header_guard(i):
                     # Extract includes from within the header guard, handling conditionals
                     j = i + 2  # Skip #ifndef and #define
                     while j < len(self.lines):
                         line = self.lines[j]
-                        line_stripped = line.strip()
+                        line_kind = self.kinds[j]
                         
                         # Check for conditional blocks within the header guard
-                        if (line_stripped.startswith('#ifdef') or line_stripped.startswith('#ifndef') or 
-                            line_stripped.startswith('#if defined')):
+                        if line_kind in _CONDITIONALS:
                             # Extract the conditional block
-                            if self._block_contains_includes(j):
-                                block = self._extract_conditional_block(j)
+                            if self.block_info[j].has_include:
+                                block, j = self._take_block(j)
                                 conditional_blocks.append(block)
-                            j = self._skip_to_endif(j) + 1
+                            else:
+                                j = self.block_info[j].end
+                            j += 1
                             continue
                         
                         # Extract unconditional includes
-                        if line_stripped.startswith('#include'):
-                            unconditional_includes.append(line.rstrip())
-                        elif line_stripped.startswith('#endif'):
+                        if line_kind == 'include':
+                            unconditional_includes.append(line)
+                        elif line_kind == 'endif':
                             break
                         j += 1
                     i = self._skip_header_guard(i)
                     continue
                 
-                # Look ahead to see if this block contains includes
-                if self._block_contains_includes(i):
-                    block = self._extract_conditional_block(i)
+                # Look up whether this block contains includes
+                if self.block_info[i].has_include:
+                    block, i = self._take_block(i)
                     conditional_blocks.append(block)
-                    i = self._skip_to_endif(i) + 1
+                    i += 1
                     continue
             
             # Extract unconditional includes
-            if stripped.startswith('#include'):
-                unconditional_includes.append(line.rstrip())
+            if kind == 'include':
+                unconditional_includes.append(line)
             
             i += 1
         
@@ -92,31 +222,34 @@ class HeaderParser:
         
         while i < len(self.lines):
             line = self.lines[i]
-            stripped = line.strip()
+            stripped = self.stripped[i]
+            kind = self.kinds[i]
             
             # Skip header guards, but extract defines from within them
-            if stripped.startswith('#ifndef') and self._is_header_guard(i):
+            if kind == 'ifndef' and self._is_header_guard(i):
                 # Extract defines from within the header guard
                 j = i + 2  # Skip #ifndef and #define
                 while j < len(self.lines):
                     line = self.lines[j]
-                    line_stripped = line.strip()
+                    line_kind = self.kinds[j]
                     
                     # Check for conditional blocks within the header guard
-                    if line_stripped.startswith('#ifdef') or line_stripped.startswith('#ifndef') or line_stripped.startswith('#if defined'):
-                        # Skip if contains includes (handled separately)
-                        if not self._block_contains_includes(j):
-                            # Extract conditional block
-                            if self._block_contains_defines_only(j):
-                                block = self._extract_conditional_block(j)
-                                defines.append(block)
-                        j = self._skip_to_endif(j) + 1
+                    if line_kind in _CONDITIONALS:
+                        info = self.block_info[j]
+                        # Skip if contains includes (handled separately), extract
+                        # the block if it contains defines only
+                        if not info.has_include and not info.has_impl:
+                            block, j = self._take_block(j)
+                            defines.append(block)
+                        else:
+                            j = info.end
+                        j += 1
                         continue
                     
                     # Extract simple defines (but skip multi-line macros - handled by extract_macros)
-                    if line_stripped.startswith('#define') and not self._is_macro_definition(j):
-                        defines.append(line.rstrip())
-                    elif line_stripped.startswith('#endif'):
+                    if line_kind == 'define' and not self._is_macro_definition(j):
+                        defines.append(line)
+                    elif line_kind == 'endif':
                         break
                     j += 1
                 i = self._skip_header_guard(i)
@@ -132,37 +265,22 @@ class HeaderParser:
                 i += 1
                 continue
             
-            # Handle conditional compilation blocks
-            if stripped.startswith('#ifdef') or stripped.startswith('#if defined'):
-                # Skip if contains includes (handled separately)
-                if self._block_contains_includes(i):
-                    i = self._skip_to_endif(i) + 1
-                    continue
-                
-                # Only extract conditional blocks that contain defines, not function implementations
-                if self._block_contains_defines_only(i):
-                    block = self._extract_conditional_block(i)
+            # Handle conditional compilation blocks, including #ifndef build config guards
+            if kind in _CONDITIONALS:
+                info = self.block_info[i]
+                # Skip if contains includes (handled separately); only extract
+                # conditional blocks that contain defines, not function implementations
+                if not info.has_include and not info.has_impl:
+                    block, i = self._take_block(i)
                     defines.append(block)
-                i = self._skip_to_endif(i) + 1
-                continue
-            
-            # Handle #ifndef blocks (build config guards)
-            if stripped.startswith('#ifndef'):
-                # Skip if contains includes (handled separately)
-                if self._block_contains_includes(i):
-                    i = self._skip_to_endif(i) + 1
-                    continue
-                
-                # Only extract conditional blocks that contain defines, not function implementations
-                if self._block_contains_defines_only(i):
-                    block = self._extract_conditional_block(i)
-                    defines.append(block)
-                i = self._skip_to_endif(i) + 1
+                else:
+                    i = info.end
+                i += 1
                 continue
             
             # Extract simple defines (but skip multi-line macros - handled by extract_macros)
-            if stripped.startswith('#define') and not self._is_macro_definition(i):
-                defines.append(line.rstrip())
+            if kind == 'define' and not self._is_macro_definition(i):
+                defines.append(line)
             
             i += 1
         
@@ -174,15 +292,16 @@ class HeaderParser:
         i = 0
         while i < len(self.lines):
             line = self.lines[i]
-            stripped = line.strip()
+            stripped = self.stripped[i]
+            kind = self.kinds[i]
             
             # Skip header guards, but extract content from within them
-            if stripped.startswith('#ifndef') and self._is_header_guard(i):
+            if kind == 'ifndef' and self._is_header_guard(i):
                 # Extract namespace content from within the header guard
                 j = i + 2  # Skip #ifndef and #define
                 while j < len(self.lines):
                     line = self.lines[j]
-                    line_stripped = line.strip()
+                    line_stripped = self.stripped[j]
                     
                     # Check for namespace content within the header guard
                     if line_stripped.startswith('namespace trace'):
@@ -191,19 +310,14 @@ class HeaderParser:
                         brace_count = 1
                         while j < len(self.lines) and brace_count > 0:
                             line = self.lines[j]
-                            line_stripped = line.strip()
-                            
-                            if '{' in line:
-                                brace_count += line.count('{')
-                            if '}' in line:
-                                brace_count -= line.count('}')
+                            brace_count += line.count('{') - line.count('}')
                             
                             if brace_count > 0:
-                                content.append(line.rstrip())
+                                content.append(line)
                             
                             j += 1
                         break
-                    elif line_stripped.startswith('#endif'):
+                    elif self.kinds[j] == 'endif':
                         break
                     j += 1
                 i = self._skip_header_guard(i)
@@ -214,19 +328,11 @@ class HeaderParser:
                 i += 1
                 continue
             
-            # Skip includes and defines (handled separately)
-            if (stripped.startswith('#include') or stripped.startswith('#ifndef') or
-                stripped.startswith('#ifdef') or stripped.startswith('#define') or
-                stripped.startswith('#endif') or stripped.startswith('#elif') or
-                stripped.startswith('#else')):
+            # Skip includes, defines and macros (handled separately)
+            if kind is not None:
                 i += 1
                 continue
             
-            # Skip macros (handled separately)
-            if stripped.startswith('#define') and self._is_macro_definition(i):
-                i = self._skip_macro_definition(i)
-                continue
-            
             # Extract namespace content
             if stripped.startswith('namespace trace'):
                 # Skip the opening line
@@ -235,15 +341,10 @@ class HeaderParser:
                 brace_count = 1
                 while i < len(self.lines) and brace_count > 0:
                     line = self.lines[i]
-                    stripped = line.strip()
-                    
-                    if '{' in line:
-                        brace_count += line.count('{')
-                    if '}' in line:
-                        brace_count -= line.count('}')
+                    brace_count += line.count('{') - line.count('}')
                     
                     if brace_count > 0:
-                        content.append(line.rstrip())
+                        content.append(line)
                     
                     i += 1
                 continue
@@ -257,30 +358,29 @@ class HeaderParser:
         macros = []
         i = 0
         while i < len(self.lines):
-            line = self.lines[i]
-            stripped = line.strip()
+            stripped = self.stripped[i]
+            kind = self.kinds[i]
             
             # Skip header guards, but extract macros from within them
-            if stripped.startswith('#ifndef') and self._is_header_guard(i):
+            if kind == 'ifndef' and self._is_header_guard(i):
                 # Extract macros from within the header guard
                 j = i + 2  # Skip #ifndef and #define
                 while j < len(self.lines):
-                    line = self.lines[j]
-                    line_stripped = line.strip()
+                    line_kind = self.kinds[j]
                     
                     # Extract macro definitions
-                    if line_stripped.startswith('#define') and self._is_macro_definition(j):
+                    if line_kind == 'define' and self._is_macro_definition(j):
                         macro_lines = []
                         k = j
                         while k < len(self.lines):
-                            macro_lines.append(self.lines[k].rstrip())
-                            if not self.lines[k].rstrip().endswith('\\'):
+                            macro_lines.append(self.lines[k])
+                            if not self.lines[k].endswith('\\'):
                                 break
                             k += 1
                         macros.append('\n'.join(macro_lines))
                         j = k + 1
                         continue
-                    elif line_stripped.startswith('#endif'):
+                    elif line_kind == 'endif':
                         break
                     j += 1
                 i = self._skip_header_guard(i)
@@ -292,12 +392,12 @@ class HeaderParser:
                 continue
             
             # Extract macro definitions
-            if stripped.startswith('#define') and self._is_macro_definition(i):
+            if kind == 'define' and self._is_macro_definition(i):
                 macro_lines = []
                 j = i
                 while j < len(self.lines):
-                    macro_lines.append(self.lines[j].rstrip())
-                    if not self.lines[j].rstrip().endswith('\\'):
+                    macro_lines.append(self.lines[j])
+                    if not self.lines[j].endswith('\\'):
                         break
                     j += 1
                 macros.append('\n'.join(macro_lines))
@@ -310,15 +410,21 @@ class HeaderParser:
     
     def _is_header_guard(self, i: int) -> bool:
         """Check if this is a header guard pattern"""
+        if i not in self._guard_cache:
+            self._guard_cache[i] = self._check_header_guard(i)
+        return self._guard_cache[i]
+    
+    def _check_header_guard(self, i: int) -> bool:
+        """Uncached _is_header_guard()"""
         if i + 1 >= len(self.lines):
             return False
         
-        line1 = self.lines[i].strip()
-        line2 = self.lines[i + 1].strip()
-        
-        if not line1.startswith('#ifndef'):
+        if self.kinds[i] != 'ifndef':
             return False
         
+        line1 = self.stripped[i]
+        line2 = self.stripped[i + 1]
+        
         guard_name = line1.split()[1] if len(line1.split()) > 1 else None
         if not guard_name:
             return False
@@ -333,11 +439,10 @@ class HeaderParser:
         # Look for content between the guard and the final #endif
         j = i + 2  # Skip #ifndef and #define
         while j < len(self.lines):
-            line = self.lines[j].strip()
-            if line.startswith('#endif'):
+            if self.kinds[j] == 'endif':
                 # Check if there's actual content between guard and endif
                 for k in range(i + 2, j):
-                    content_line = self.lines[k].strip()
+                    content_line = self.stripped[k]
                     if content_line and not content_line.startswith('//'):
                         return True
                 return False
@@ -347,14 +452,19 @@ class HeaderParser:
     
     def _skip_header_guard(self, i: int) -> int:
         """Skip header guard block and return new index, extracting content without guard wrapper"""
+        if i not in self._guard_end_cache:
+            self._guard_end_cache[i] = self._find_header_guard_end(i)
+        return self._guard_end_cache[i]
+    
+    def _find_header_guard_end(self, i: int) -> int:
+        """Uncached _skip_header_guard()"""
         # Skip #ifndef and #define lines
         i += 2
         
         # Find matching #endif at the end of file
         while i < len(self.lines):
-            line = self.lines[i].strip()
-            if line.startswith('#endif') and (i == len(self.lines) - 1 or 
-                (i + 1 < len(self.lines) and not self.lines[i + 1].strip())):
+            if self.kinds[i] == 'endif' and (i == len(self.lines) - 1 or 
+                (i + 1 < len(self.lines) and not self.stripped[i + 1])):
                 return i + 1
             i += 1
         
@@ -362,12 +472,18 @@ class HeaderParser:
     
     def _is_macro_definition(self, i: int) -> bool:
         """Check if this is a macro definition (not a simple define)"""
-        line = self.lines[i].strip()
-        if not line.startswith('#define'):
+        if i not in self._macro_cache:
+            self._macro_cache[i] = self._check_macro_definition(i)
+        return self._macro_cache[i]
+    
+    def _check_macro_definition(self, i: int) -> bool:
+        """Uncached _is_macro_definition()"""
+        if self.kinds[i] != 'define':
             return False
         
+        line = self.stripped[i]
         # Check if it's a function-like macro or multi-line macro
-        return ('(' in line and ')' in line) or (i + 1 < len(self.lines) and self.lines[i + 1].strip().endswith('\\'))
+        return ('(' in line and ')' in line) or (i + 1 < len(self.lines) and self.stripped[i + 1].endswith('\\'))
     
     def _is_likely_header_guard_end(self, i: int) -> bool:
         """Check if this #endif is likely the end of a header guard"""
@@ -377,7 +493,7 @@ class HeaderParser:
         
         # Check if followed by empty lines or comments
         for j in range(i + 1, len(self.lines)):
-            line = self.lines[j].strip()
+            line = self.stripped[j]
             if line and not line.startswith('//'):
                 return False
             if line.startswith('//') and 'TRACE_SCOPE' in line:
@@ -385,88 +501,67 @@ class HeaderParser:
         
         return True
     
-    def _block_contains_includes(self, start_idx: int) -> bool:
-        """Check if conditional block contains #include statements"""
-        i = start_idx + 1
-        depth = 1
-        
-        while i < len(self.lines) and depth > 0:
-            line = self.lines[i].strip()
-            if line.startswith('#include'):
-                return True
-            if line.startswith('#endif'):
-                depth -= 1
-            elif line.startswith('#ifdef') or line.startswith('#ifndef') or line.startswith('#if defined'):
-                depth += 1
-            i += 1
-        
-        return False
-    
-    def _block_contains_defines_only(self, start_idx: int) -> bool:
-        """Check if conditional block contains only defines, not function implementations"""
-        i = start_idx + 1
-        depth = 1
-        
-        while i < len(self.lines) and depth > 0:
-            line = self.lines[i].strip()
-            
-            # Check for function implementations (indicates this is not a defines-only block)
-            if (line.startswith('inline ') or line.startswith('FILE* ') or 
-                line.startswith('return ') or line.startswith('if ') or
-                line.startswith('FILE* file') or 'fopen_s' in line or 'tmpfile_s' in line):
-                return False
-            
-            # Check for namespace (indicates this is not a defines-only block)
-            if line.startswith('namespace '):
-                return False
-            
-            if line.startswith('#endif'):
-                depth -= 1
-            elif line.startswith('#ifdef') or line.startswith('#ifndef'):
-                depth += 1
-            i += 1
-        
-        return True
-    
-    def _extract_conditional_block(self, start_idx: int) -> str:
-        """Extract complete conditional block as a string"""
-        lines = []
-        i = start_idx
-        depth = 0
-        
-        while i < len(self.lines):
-            line = self.lines[i]
-            stripped = line.strip()
-            
-            if stripped.startswith('#ifdef') or stripped.startswith('#ifndef') or stripped.startswith('#if defined'):
-                depth += 1
-            elif stripped.startswith('#endif'):
-                lines.append(line.rstrip())
-                depth -= 1
-                if depth == 0:
-                    break
-            
-            lines.append(line.rstrip())
-            i += 1
-        
-        return '\n'.join(lines)
-    
-    def _skip_to_endif(self, start_idx: int) -> int:
-        """Skip to matching #endif and return its index"""
-        i = start_idx + 1
-        depth = 1
-        
-        while i < len(self.lines) and depth > 0:
-            line = self.lines[i].strip()
-            if line.startswith('#ifdef') or line.startswith('#ifndef') or line.startswith('#if defined'):
-                depth += 1
-            elif line.startswith('#endif'):
-                depth -= 1
-                if depth == 0:
-                    return i
-            i += 1
+    def _take_block(self, start_idx: int) -> Tuple[str, int]:
+        """Take a complete conditional block as a string, with the index of its #endif"""
+        end = self.block_info[start_idx].end
+        return '\n'.join(self.lines[start_idx:end + 1]), end
+
+class ParseCache:
+    """ParseResults of earlier runs, reused while a module is unchanged"""
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._files: Dict[Path, Path] = {}
         
-        return i
+        # A changed parser may extract differently, so it gets fresh entries
+        self._salt = b''
+        if enabled:
+            stat = os.stat(__file__)
+            self._salt = f"{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8')
+    
+    def get(self, module_path: Path) -> Optional[ParseResult]:
+        """Return a previous parse result if the module content is unchanged"""
+        if not self.enabled:
+            return None
+        try:
+            with open(self._cache_file(module_path), 'rb') as f:
+                result = ParseResult(*pickle.load(f))
+        except Exception:
+            # Unreadable, truncated or foreign entries are simply parsed again
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+    
+    def put(self, module_path: Path, result: ParseResult):
+        """Save a parse result for reuse by later merges"""
+        if not self.enabled:
+            return
+        cache_file = self._cache_file(module_path)
+        # Stored as a plain tuple so the entry does not depend on whether this
+        # module ran as a script or was imported, and written to a temporary
+        # file first so a reader never sees a partial entry
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(tuple(result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not write parse cache {cache_file}: {e}")
+    
+    def _cache_file(self, module_path: Path) -> Path:
+        """Cache entry for the current content of a module"""
+        if module_path not in self._files:
+            digest = hashlib.sha256(self._salt + module_path.read_bytes()).hexdigest()
+            self._files[module_path] = CACHE_DIR / f"{digest}.pkl"
+        return self._files[module_path]
+
+def _parse_module(module_path: Path) -> ParseResult:
+    """Parse a single module; a module-level function so any executor can run it"""
+    return HeaderParser(module_path).parse()
 
 def analyze_macro_dependencies(macros: List[str]) -> List[str]:
     """Analyze macro dependencies and return ordered list"""
@@ -474,93 +569,106 @@ def analyze_macro_dependencies(macros: List[str]) -> List[str]:
     macro_info = {}
     
     for macro in macros:
-        lines = macro.split('\n')
-        first_line = lines[0].strip()
+        first_line = macro.split('\n', 1)[0].strip()
         
         # Extract macro name
         if first_line.startswith('#define'):
-            parts = first_line.split()
-            if len(parts) >= 2:
-                macro_name = parts[1].split('(')[0]  # Remove function parameters
-                
-                # Find dependencies (other macros used in this macro)
-                dependencies = set()
-                for line in lines:
-                    # Look for macro names in the macro body
-                    for word in re.findall(r'\b[A-Z_][A-Z0-9_]*\b', line):
-                        if word != macro_name and word in [name for name in macro_info.keys()]:
-                            dependencies.add(word)
+            macro_name = _define_name(first_line)
+            if macro_name is not None:
+                # Find dependencies (other macros used in this macro), scanning the
+                # whole definition at once; only macros defined before this one
+                # count, and macro_info doubles as the set of their names. They
+                # are kept in order of use so the output does not depend on set order
+                dependencies = list(OrderedDict.fromkeys(
+                    word for word in _IDENT_RE.findall(macro)
+                    if word != macro_name and word in macro_info
+                ))
                 
                 macro_info[macro_name] = {
                     'definition': macro,
                     'dependencies': dependencies
                 }
     
-    # Topological sort to order dependencies first
+    # Topological sort to order dependencies first: a depth-first walk in
+    # definition order, with an explicit stack so that long macro chains
+    # cannot exhaust the recursion limit
     ordered = []
     visited = set()
     
-    def visit(macro_name):
-        if macro_name in visited:
-            return
-        visited.add(macro_name)
+    for root in macro_info:
+        if root in visited:
+            continue
+        visited.add(root)
         
-        if macro_name in macro_info:
-            for dep in macro_info[macro_name]['dependencies']:
-                visit(dep)
-            ordered.append(macro_info[macro_name]['definition'])
-    
-    for macro_name in macro_info:
-        visit(macro_name)
+        # Macros being visited, with their position on the stack
+        stack = [(root, iter(macro_info[root]['dependencies']))]
+        on_stack = {root: 0}
+        while stack:
+            macro_name, dependencies = stack[-1]
+            for dep in dependencies:
+                if dep not in visited:
+                    visited.add(dep)
+                    on_stack[dep] = len(stack)
+                    stack.append((dep, iter(macro_info[dep]['dependencies'])))
+                    break
+                if dep in on_stack:
+                    # Valid for the preprocessor, but no order puts every
+                    # dependency first; the cycle is broken here
+                    cycle = [name for name, _ in stack[on_stack[dep]:]] + [dep]
+                    print(f"Warning: Macro dependency cycle: {' -> '.join(cycle)}")
+            else:
+                stack.pop()
+                del on_stack[macro_name]
+                ordered.append(macro_info[macro_name]['definition'])
     
     return ordered
 
 def deduplicate_includes(includes: List[str]) -> List[str]:
     """Deduplicate includes and sort them"""
-    seen = set()
-    system_includes = []
-    project_includes = []
-    
-    for include in includes:
-        if include not in seen:
-            seen.add(include)
-            if include.startswith('#include <'):
-                system_includes.append(include)
-            else:
-                project_includes.append(include)
+    unique = dict.fromkeys(includes)
     
-    # Sort system includes alphabetically
-    system_includes.sort()
-    project_includes.sort()
+    # Sort system includes alphabetically, then project includes
+    system_includes = sorted(include for include in unique if include.startswith('#include <'))
+    project_includes = sorted(include for include in unique if not include.startswith('#include <'))
     
     return system_includes + project_includes
 
+def _define_name(define: str) -> Optional[str]:
+    """Name a #define line defines, without function parameters"""
+    match = _DEFINE_NAME_RE.match(define)
+    return match.group(1) if match else None
+
 def deduplicate_defines(defines: List[str]) -> List[str]:
     """Deduplicate defines, keeping first occurrence"""
-    seen = set()
-    result = []
+    # Insertion order is output order; defines are keyed by name so only the
+    # first of each is kept, other directives by position so all of them are
+    result: Dict[object, str] = OrderedDict()
     
-    for define in defines:
-        # Extract the define name for deduplication
+    for i, define in enumerate(defines):
         if define.startswith('#define'):
-            parts = define.split()
-            if len(parts) >= 2:
-                define_name = parts[1].split('(')[0]  # Remove function parameters
-                if define_name not in seen:
-                    seen.add(define_name)
-                    result.append(define)
+            # A #define without a name is dropped
+            define_name = _define_name(define)
+            if define_name is not None:
+                result.setdefault(define_name, define)
         else:
             # Keep non-define preprocessor directives
-            result.append(define)
+            result[i] = define
     
-    return result
+    return list(result.values())
 
 def deduplicate_conditional_blocks(blocks: List[str]) -> List[str]:
     """Deduplicate conditional compilation blocks"""
     seen = set()
+    seen_exact = set()
     result = []
     
     for block in blocks:
+        # Most duplicates are byte-identical copies from other modules; only
+        # a block not seen verbatim is normalized
+        if block in seen_exact:
+            continue
+        seen_exact.add(block)
+        
         # Normalize whitespace for comparison
         normalized = ' '.join(block.split())
         if normalized not in seen:
@@ -598,20 +706,63 @@ def read_modules_list(input_dir: Path) -> List[str]:
         raise FileNotFoundError(f"modules.txt not found in {input_dir}")
     
     modules = []
-    with open(modules_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            # Skip empty lines and comments
-            if line and not line.startswith('#'):
-                modules.append(line)
+    for line in modules_file.read_bytes().decode('utf-8').splitlines():
+        line = line.strip()
+        # Skip empty lines and comments
+        if line and not line.startswith('#'):
+            modules.append(line)
     
     return modules
 
-def generate_header(input_dir: Path, output_file: Path):
+class _HeaderWriter:
+    """Stream the merged header to a file that replaces the output when complete
+    
+    Text is encoded and written as it is produced, so the whole header is
+    never held in memory. It lands in a temporary file first, so an
+    interrupted run never leaves a truncated header behind for the build
+    to pick up.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_file = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        self.size = 0
+        self.lines = 0
+    
+    def __enter__(self):
+        self._file = open(self.tmp_file, 'wb')
+        return self
+    
+    def write(self, text: str):
+        """Append text, keeping count of bytes and lines written"""
+        data = text.encode('utf-8')
+        self._file.write(data)
+        self.size += len(data)
+        self.lines += text.count('\n')
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._file.close()
+            if exc_type is None:
+                os.replace(self.tmp_file, self.path)
+                return
+        except OSError:
+            self._discard()
+            raise
+        self._discard()
+    
+    def _discard(self):
+        try:
+            os.unlink(self.tmp_file)
+        except OSError:
+            pass
+
+def generate_header(input_dir: Path, output_file: Path, use_cache: bool = True):
     """Generate merged header file with proper structure"""
     
     input_dir = Path(input_dir)
     output_file = Path(output_file)
+    cache = ParseCache(enabled=use_cache)
     
     # Read module list
     modules = read_modules_list(input_dir)
@@ -633,8 +784,7 @@ def generate_header(input_dir: Path, output_file: Path):
  * Source files (in merge order):
 """
     
-    for module in modules:
-        header_comment += f" *   - {module}\n"
+    header_comment += ''.join(f" *   - {module}\n" for module in modules)
     
     header_comment += """ * 
  * To regenerate this file:
@@ -653,20 +803,39 @@ def generate_header(input_dir: Path, output_file: Path):
     all_namespace_content = []
     all_macros = []
     
+    module_paths = []
     for module in modules:
         module_path = input_dir / module
         
         if not module_path.exists():
             raise FileNotFoundError(f"Module not found: {module_path}")
-        
-        # Parse and extract content
-        parser = HeaderParser(module_path)
-        uncond_includes, cond_blocks = parser.extract_includes()
-        all_unconditional_includes.extend(uncond_includes)
-        all_conditional_include_blocks.extend(cond_blocks)
-        all_defines.extend(parser.extract_defines())
-        all_namespace_content.extend(parser.extract_namespace_content())
-        all_macros.extend(parser.extract_macros())
+        module_paths.append(module_path)
+    
+    # Parse and extract content, unless an earlier run already did
+    results: Dict[Path, ParseResult] = {}
+    pending = []
+    for module_path in module_paths:
+        cached = cache.get(module_path)
+        if cached is not None:
+            results[module_path] = cached
+        else:
+            pending.append(module_path)
+    
+    # Modules are independent, so their reads and parses can overlap
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as executor:
+            for module_path, result in zip(pending, executor.map(_parse_module, pending)):
+                results[module_path] = result
+                cache.put(module_path, result)
+    
+    # Combine in merge order
+    for module_path in module_paths:
+        result = results[module_path]
+        all_unconditional_includes.extend(result.unconditional_includes)
+        all_conditional_include_blocks.extend(result.conditional_blocks)
+        all_defines.extend(result.defines)
+        all_namespace_content.extend(result.namespace_content)
+        all_macros.extend(result.macros)
     
     # Phase 2: Deduplicate and organize
     includes = deduplicate_includes(all_unconditional_includes)
@@ -675,55 +844,55 @@ def generate_header(input_dir: Path, output_file: Path):
     namespace_content = deduplicate_namespace_content(all_namespace_content)
     macros = analyze_macro_dependencies(all_macros)
     
-    # Phase 3: Generate output
-    merged_content = header_comment
-    
-    # Add unconditional includes
-    if includes:
-        merged_content += "// Standard C++ includes\n"
-        for include in includes:
-            merged_content += f"{include}\n"
-        merged_content += "\n"
-    
-    # Add conditional include blocks
-    if conditional_blocks:
-        merged_content += "// Platform-specific includes\n"
-        for block in conditional_blocks:
-            merged_content += f"{block}\n"
-        merged_content += "\n"
-    
-    # Add defines
-    if defines:
-        merged_content += "// Build config defines\n"
-        for define in defines:
-            merged_content += f"{define}\n"
-        merged_content += "\n"
-    
-    # Add namespace
-    merged_content += "// Single namespace\n"
-    merged_content += "namespace trace {\n\n"
-    
-    # Add namespace content
-    for line in namespace_content:
-        merged_content += f"{line}\n"
-    
-    merged_content += "\n} // namespace trace\n\n"
-    
-    # Add macros
-    if macros:
-        merged_content += "// Macros (outside namespace)\n"
-        for macro in macros:
-            merged_content += f"{macro}\n"
-        merged_content += "\n"
-    
-    # Write output
+    # Phase 3: Generate output, streamed straight to the file
     output_file.parent.mkdir(parents=True, exist_ok=True)
-    output_file.write_text(merged_content, encoding='utf-8')
+    with _HeaderWriter(output_file) as out:
+        out.write(header_comment)
+        
+        # Add unconditional includes
+        if includes:
+            out.write("// Standard C++ includes\n")
+            for include in includes:
+                out.write(f"{include}\n")
+            out.write("\n")
+        
+        # Add conditional include blocks
+        if conditional_blocks:
+            out.write("// Platform-specific includes\n")
+            for block in conditional_blocks:
+                out.write(f"{block}\n")
+            out.write("\n")
+        
+        # Add defines
+        if defines:
+            out.write("// Build config defines\n")
+            for define in defines:
+                out.write(f"{define}\n")
+            out.write("\n")
+        
+        # Add namespace
+        out.write("// Single namespace\n")
+        out.write("namespace trace {\n\n")
+        
+        # Add namespace content
+        for line in namespace_content:
+            out.write(f"{line}\n")
+        
+        out.write("\n} // namespace trace\n\n")
+        
+        # Add macros
+        if macros:
+            out.write("// Macros (outside namespace)\n")
+            for macro in macros:
+                out.write(f"{macro}\n")
+            out.write("\n")
     
     print(f"✓ Generated {output_file}")
     print(f"  Merged {len(modules)} modules")
-    print(f"  Total size: {len(merged_content):,} bytes")
-    print(f"  Total lines: {len(merged_content.splitlines()):,}")
+    print(f"  Total size: {out.size:,} bytes")
+    print(f"  Total lines: {out.lines:,}")
+    if cache.enabled:
+        print(f"  Parse cache: {cache.hits} hits, {cache.misses} misses")
 
 def main():
     parser = argparse.ArgumentParser(
@@ -740,11 +909,13 @@ Examples:
                        help='Input directory containing module headers')
     parser.add_argument('-o', '--output', required=True,
                        help='Output path for merged header file')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Re-parse every module instead of using the parse cache')
     
     args = parser.parse_args()
     
     try:
-        generate_header(args.input, args.output)
+        generate_header(args.input, args.output, use_cache=not args.no_cache)
     except Exception as e:
         print(f"Error: {e}")
         return 1